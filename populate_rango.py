@@ -3,7 +3,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.setti
 
 import django
 django.setup()
-from rango.models import Category, Page
+from rango.loader import Loader
 
 def populate():
     # Create a list of dictionaries containing pages to add to each category
@@ -65,28 +65,16 @@ def populate():
         "Other Frameworks": {"pages": other_pages,  "views": 32, "likes": 16}
     }
 
+    # one row per page, loaded in bulk (re-running the script is safe)
+    rows = []
     for cat, cat_data in cats.items():
-        c = add_cat(cat, cat_data["views"], cat_data["likes"])
         for p in cat_data["pages"]:
-            add_page(c, p["title"], p["url"], p["views"])
+            rows.append({"category": cat, "category_views": cat_data["views"], "category_likes": cat_data["likes"],
+                         "title": p["title"], "url": p["url"], "views": p["views"]})
 
-    for c in Category.objects.all():
-        for p in Page.objects.filter(category=c):
-            print("- {0} - {1}".format(str(c), str(p)))
-
-def add_page(cat, title, url, views):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url=url
-    p.views=views
-    p.save()
-    return p
-
-def add_cat(name, views, likes):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views = views
-    c.likes = likes
-    c.save()
-    return c
+    stats = Loader().load(rows)
+    print("Added {0} categories and {1} pages, updated {2} categories and {3} pages".format(
+        stats["categories_created"], stats["pages_created"], stats["categories_updated"], stats["pages_updated"]))
 
 if __name__ == '__main__':
     print("Starting Rango population script...")
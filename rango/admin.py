@@ -1,5 +1,5 @@
 from django.contrib import admin
-from rango.models import Category, Page, UserProfile
+from rango.models import Category, CategoryLike, Job, Page, UserProfile
 
 # Register your models here.
 
@@ -9,6 +9,12 @@ class CategoryAdmin(admin.ModelAdmin):
 class PageAdmin(admin.ModelAdmin):
     list_display = ('title', 'category', 'url')
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'finished')
+    list_filter = ('status', 'name')
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
+admin.site.register(CategoryLike)
+admin.site.register(Job, JobAdmin)
 admin.site.register(UserProfile)
\ No newline at end of file
@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from rango.models import Category, Page
+
+# categories per UPDATE when reconciling, keeps the IN list within SQLite's limits
+RECONCILE_BATCH_SIZE = 500
+
+
+def adjust(category_id, pages=0, views=0):
+    if pages or views:
+        Category.objects.filter(id=category_id).update(page_count=F('page_count') + pages,
+                                                       total_views=F('total_views') + views)
+
+def page_saved(page, created):
+    '''
+        Moves Category.page_count and total_views by what changed in this save.
+    '''
+    if created:
+        adjust(page.category_id, 1, page.views)
+    elif hasattr(page, 'counted') and 'category_id' in page.counted and 'views' in page.counted:
+        old_category_id, old_views = page.counted['category_id'], page.counted['views']
+        if old_category_id != page.category_id:
+            adjust(old_category_id, -1, -old_views)
+            adjust(page.category_id, 1, page.views)
+        else:
+            adjust(page.category_id, 0, page.views - old_views)
+    # anything else (e.g. a page loaded with only()) is left for reconcile to catch
+
+    page.counted = {'category_id': page.category_id, 'views': page.views}
+
+def page_deleted(page):
+    adjust(page.category_id, -1, -page.views)
+
+def views_added(counts):
+    '''
+        counts maps page id -> views just added with F('views') + n.
+    '''
+    by_category = {}
+    for page_id, category_id in Page.objects.filter(id__in=list(counts)).values_list('id', 'category_id'):
+        by_category[category_id] = by_category.get(category_id, 0) + counts[page_id]
+
+    # group categories by increment, like the page updates
+    by_increment = {}
+    for category_id, views in by_category.items():
+        by_increment.setdefault(views, []).append(category_id)
+
+    with transaction.atomic():
+        for views, category_ids in by_increment.items():
+            Category.objects.filter(id__in=category_ids).update(total_views=F('total_views') + views)
+
+def actual_totals():
+    pages = Page.objects.filter(category=OuterRef('pk')).order_by().values('category')
+    return {
+        'actual_page_count': Coalesce(Subquery(pages.annotate(n=Count('id')).values('n'),
+                                               output_field=IntegerField()), 0),
+        'actual_total_views': Coalesce(Subquery(pages.annotate(n=Sum('views')).values('n'),
+                                                output_field=IntegerField()), 0),
+    }
+
+def reconcile(category_ids=None):
+    '''
+        Recounts the totals from the pages table, for every category or just
+        the ones given, and returns how many categories had drifted.
+    '''
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+
+    drifted = list(categories.annotate(**actual_totals())
+                   .exclude(page_count=F('actual_page_count'), total_views=F('actual_total_views'))
+                   .values_list('id', flat=True))
+
+    # a few UPDATEs for all of them, the subqueries work the totals out in the database
+    totals = actual_totals()
+    for i in range(0, len(drifted), RECONCILE_BATCH_SIZE):
+        Category.objects.filter(id__in=drifted[i:i + RECONCILE_BATCH_SIZE]).update(
+            page_count=totals['actual_page_count'], total_views=totals['actual_total_views'])
+    return len(drifted)
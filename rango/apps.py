@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # connect the signal handlers that keep our caches up to date
+        import rango.signals
+        import rango.db
+
+        # read the search API key now rather than on every search
+        from rango.config import setup_search_key
+        setup_search_key()
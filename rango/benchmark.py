@@ -0,0 +1,136 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.template.defaultfilters import slugify
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from rango.loader import Loader
+from rango.models import Category, Page, UserProfile
+from rango.urls import app_name, urlpatterns
+
+WORDS = ['python', 'django', 'tango', 'rango', 'flask', 'bottle', 'tutorial', 'official', 'learn',
+         'think', 'computer', 'scientist', 'rocks', 'framework', 'web', 'minutes', 'guide', 'howto']
+
+# extra GET parameters for urls that need them, filled in from the generated data
+QUERY_PARAMS = {
+    'goto': lambda data: {'page_id': data['page_id']},
+    'search': lambda data: {'query': 'django tutorial'},
+}
+
+# views that only make sense as a POST or change data, so aren't benchmarked with a GET
+SKIP = {'add_category', 'add_page', 'register_profile', 'like_category', 'add_pages'}
+
+
+def generate(n_categories, n_pages, seed=42):
+    '''
+        Synthetic data in the same shape populate_rango.py uses:
+        {category name: {'pages': [{'title', 'url', 'views'}], 'views', 'likes'}}
+    '''
+    rng = random.Random(seed)
+    cats = {}
+
+    for i in range(n_categories):
+        name = f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}'
+        cats[name] = {'pages': [], 'views': rng.randint(0, 1000), 'likes': rng.randint(0, 500)}
+
+    names = list(cats)
+    for i in range(n_pages):
+        title = ' '.join(rng.choice(WORDS).title() for j in range(3))
+        cats[rng.choice(names)]['pages'].append({
+            'title': f'{title} {i}',
+            'url': f'http://www.{rng.choice(WORDS)}.com/{i}/',
+            'views': rng.randint(0, 10000),
+        })
+
+    return cats
+
+def rows(cats):
+    for name, data in cats.items():
+        for page in data['pages']:
+            yield {'category': name, 'category_views': data['views'], 'category_likes': data['likes'],
+                   'title': page['title'], 'url': page['url'], 'views': page['views']}
+
+def load(cats, n_users):
+    '''
+        Writes the generated data with the bulk loader, plus n_users users with profiles.
+    '''
+    Loader().load(rows(cats))
+
+    User.objects.bulk_create([User(username=f'user{i}') for i in range(n_users)])
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id, website=f'http://www.{slugify(username)}.com/')
+         for username, user_id in User.objects.filter(username__startswith='user').values_list('username', 'id')])
+
+def sample_data():
+    category = Category.objects.order_by('-likes').first()
+    return {
+        'category_name_slug': category.slug,
+        'username': User.objects.order_by('id').values_list('username', flat=True).first(),
+        'page_id': Page.objects.filter(category=category).values_list('id', flat=True).first(),
+    }
+
+def targets(data):
+    '''
+        (name, url) for every url in rango/urls.py, with its arguments filled in from data.
+    '''
+    for pattern in urlpatterns:
+        if not isinstance(pattern, URLPattern) or pattern.name in SKIP:
+            continue
+
+        kwargs = {name: data[name] for name in pattern.pattern.converters}
+        url = reverse(f'{app_name}:{pattern.name}', kwargs=kwargs)
+        yield f'{app_name}:{pattern.name}', url, QUERY_PARAMS.get(pattern.name, lambda data: {})(data)
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def run(requests=100, warmup=5, username=None):
+    '''
+        GETs every url requests times and returns latency percentiles (ms),
+        throughput (requests/s) and query counts for each.
+    '''
+    client = Client()
+    if username:
+        client.force_login(User.objects.get(username=username))
+
+    data = sample_data()
+    results = {}
+
+    for name, url, params in targets(data):
+        for i in range(warmup):
+            client.get(url, params)
+
+        latencies = []
+        queries = []
+        status = None
+        start = time.perf_counter()
+
+        for i in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                request_start = time.perf_counter()
+                response = client.get(url, params)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append((time.perf_counter() - request_start) * 1000)
+            queries.append(len(captured))
+            status = response.status_code
+
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'url': url,
+            'status': status,
+            'requests': requests,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'throughput_rps': requests / elapsed,
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+        }
+
+    return results
@@ -1,36 +1,190 @@
+import hashlib
 import json
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from rango.config import get_search_key
+
+
+class SearchUnavailable(Exception):
+    '''
+        The search API failed, or has been failing and is being left alone for a while.
+    '''
+    pass
+
+class SingleFlight(object):
+    '''
+        Coalesces concurrent calls for the same key, so only the first caller
+        does the work and everyone else waiting on that key gets its result.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
 
-def read_bing_key():
-    bing_api_key = None
-    try:
-        with open('bing.key', 'r') as f:
-            bing_api_key = f.readline().strip()
-    except:
         try:
-            with open('../bing.key') as f:
-                bing_api_key = f.readline().strip()
-        except:
-            raise IOError('bing.key file not found')
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+        return call['result']
+
+in_flight = SingleFlight()
+
+class CircuitBreaker(object):
+    '''
+        Stops calling the API after failure_threshold failures in a row. Once
+        reset_timeout seconds have passed one trial call is let through, which
+        closes the breaker again if it succeeds.
+    '''
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # half open - let this caller try, everyone else waits for the next timeout
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures = self.failures + 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+class SearchClient(object):
+    '''
+        Keep-alive connection pool to the search API, with timeouts, retries
+        (with backoff) and a circuit breaker in front of it.
+    '''
 
-    if not bing_api_key:
-        raise KeyError('bing key not found')
+    def __init__(self):
+        retries = Retry(total=settings.RANGO_SEARCH_RETRIES,
+                        backoff_factor=settings.RANGO_SEARCH_BACKOFF,
+                        status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.RANGO_SEARCH_POOL_SIZE, max_retries=retries)
 
-    return bing_api_key
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = (settings.RANGO_SEARCH_CONNECT_TIMEOUT, settings.RANGO_SEARCH_READ_TIMEOUT)
+        self.breaker = CircuitBreaker(settings.RANGO_SEARCH_BREAKER_THRESHOLD, settings.RANGO_SEARCH_BREAKER_RESET)
+
+    def get(self, url, **kwargs):
+        if not self.breaker.allow():
+            raise SearchUnavailable('Search is switched off after repeated failures.')
+
+        try:
+            response = self.session.get(url, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise SearchUnavailable(str(e)) from e
+
+        self.breaker.record_success()
+        return response
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_search_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SearchClient()
+    return _client
+
+@receiver(setting_changed)
+def reset_search_client(**kwargs):
+    global _client
+    if kwargs['setting'].startswith('RANGO_SEARCH_'):
+        _client = None
+
+def normalize_query(search_terms):
+    # case and spacing don't change the results, so don't let them split the cache
+    return ' '.join(search_terms.lower().split())
+
+def search_cache_key(query):
+    return 'rango:search:' + hashlib.sha1(query.encode('utf-8')).hexdigest()
 
 def run_query(search_terms):
+    '''
+        Results are cached per normalized query, and identical searches running
+        at the same time share a single request to the API.
+    '''
+    query = normalize_query(search_terms)
+    key = search_cache_key(query)
+    search_cache = caches[settings.RANGO_SEARCH_CACHE]
+
+    results = search_cache.get(key)
+    if results is not None:
+        return results
+
+    def fetch():
+        # someone else may have filled the cache while we waited for the lock
+        results = search_cache.get(key)
+        if results is None:
+            results = fetch_results(query)
+            search_cache.set(key, results, settings.RANGO_SEARCH_CACHE_TTL)
+        return results
+
+    return in_flight.do(key, fetch)
+
+def fetch_results(search_terms):
     '''
         See microsoft documentation on other parameters that we can set
     '''
 
-    bing_key = read_bing_key()
-    search_url = 'https://api.cognitive.microsoft.com/bing/v7.0/search'
+    bing_key = get_search_key()
+    search_url = settings.RANGO_SEARCH_URL
     headers = {'Ocp-Apim-Subscription-Key': bing_key}
     params = {'q': search_terms, 'textDecorations': True, 'textFormat':'HTML'}
 
     # issue the request, given the details above
-    response = requests.get(search_url, headers=headers, params=params)
-    response.raise_for_status()
+    # this goes through the shared connection pool, and raises SearchUnavailable if it fails
+    response = get_search_client().get(search_url, headers=headers, params=params)
     search_results = response.json()
 
     # With the response now in play, build a Python list
@@ -54,13 +208,8 @@ def main():
         print('===============')
 
 if __name__ == '__main__':
+    import os
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.settings')
+    django.setup()
     main()
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,232 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from rango.metrics import registry
+
+MISSING = object()
+
+
+class LRUCache(object):
+    '''
+        Small thread-safe, per-process cache with a size bound and a time to live.
+        Least recently used entries are dropped first once maxsize is reached.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            try:
+                value, expires = self.data[key]
+            except KeyError:
+                self.misses = self.misses + 1
+                return default
+
+            if expires is not None and expires < time.time():
+                del self.data[key]
+                self.misses = self.misses + 1
+                return default
+
+            self.data.move_to_end(key)
+            self.hits = self.hits + 1
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.data), 'maxsize': self.maxsize}
+
+
+class PageURLCache(object):
+    '''
+        Maps page id -> url for GoToView, checked in order: this process,
+        the shared Django cache (if one is configured), then the database.
+    '''
+
+    def __init__(self):
+        self.local = LRUCache(maxsize=getattr(settings, 'RANGO_REDIRECT_CACHE_SIZE', 10000),
+                              ttl=getattr(settings, 'RANGO_REDIRECT_CACHE_TTL', 300))
+        self.alias = getattr(settings, 'RANGO_REDIRECT_CACHE', None)
+        self.shared_hits = 0
+
+    def key(self, page_id):
+        return f'rango:page_url:{page_id}'
+
+    def get(self, page_id):
+        from rango.models import Page
+
+        page_id = int(page_id)
+        url = self.local.get(page_id)
+        if url is not MISSING:
+            return url
+
+        if self.alias:
+            url = caches[self.alias].get(self.key(page_id))
+            if url is not None:
+                self.shared_hits = self.shared_hits + 1
+                self.local.set(page_id, url)
+                return url
+
+        url = Page.objects.filter(id=page_id).values_list('url', flat=True).first()
+        if url is not None:
+            self.local.set(page_id, url)
+            if self.alias:
+                caches[self.alias].set(self.key(page_id), url, self.local.ttl)
+
+        return url
+
+    def invalidate(self, page_id):
+        self.local.delete(page_id)
+        if self.alias:
+            caches[self.alias].delete(self.key(page_id))
+
+    def stats(self):
+        stats = self.local.stats()
+        # anything found in the shared cache was a local miss, but not a trip to the database
+        stats['shared_hits'] = self.shared_hits
+        stats['misses'] = stats['misses'] - self.shared_hits
+        stats['hits'] = stats['hits'] + self.shared_hits
+        return stats
+
+
+_page_urls = None
+_page_urls_lock = threading.Lock()
+
+def get_page_url_cache():
+    global _page_urls
+    with _page_urls_lock:
+        if _page_urls is None:
+            _page_urls = PageURLCache()
+    return _page_urls
+
+@receiver(setting_changed)
+def reset_page_url_cache(**kwargs):
+    global _page_urls
+    if kwargs['setting'].startswith('RANGO_REDIRECT_CACHE'):
+        _page_urls = None
+
+def get_page_url(page_id):
+    return get_page_url_cache().get(page_id)
+
+def invalidate_page_url(page_id):
+    get_page_url_cache().invalidate(page_id)
+
+@registry.register
+def page_url_cache_metrics():
+    stats = get_page_url_cache().stats()
+    return [
+        ('rango_redirect_cache_hits_total', 'counter', 'Goto redirects served without a database lookup.',
+         [({}, stats['hits'])]),
+        ('rango_redirect_cache_misses_total', 'counter', 'Goto redirects that looked the page up in the database.',
+         [({}, stats['misses'])]),
+        ('rango_redirect_cache_size', 'gauge', 'Redirect targets held in this process.',
+         [({}, stats['size'])]),
+    ]
+
+
+class CategoryCache(object):
+    '''
+        Maps slug -> Category for every view that looks a category up by slug.
+        Kept per process, and per request on top so one request never asks twice.
+    '''
+
+    def __init__(self):
+        self.local = LRUCache(maxsize=getattr(settings, 'RANGO_CATEGORY_CACHE_SIZE', 1000),
+                              ttl=getattr(settings, 'RANGO_CATEGORY_CACHE_TTL', 60))
+
+    def get(self, slug, request=None):
+        from rango.models import Category
+
+        seen = getattr(request, '_rango_categories', None)
+        if seen is None:
+            seen = {}
+            if request is not None:
+                request._rango_categories = seen
+        if slug in seen:
+            return seen[slug]
+
+        category = self.local.get(slug)
+        if category is MISSING:
+            category = Category.objects.filter(slug=slug).first()
+            # unknown slugs aren't remembered, the category may be added in another process
+            if category is not None:
+                self.local.set(slug, category)
+
+        # each request gets its own copy, the cached one is shared between threads
+        category = copy.copy(category)
+        seen[slug] = category
+        return category
+
+    def invalidate(self):
+        # a save can rename (and so re-slug) a category, so forget them all - they change rarely
+        self.local.clear()
+
+
+_categories = None
+_categories_lock = threading.Lock()
+
+def get_category_cache():
+    global _categories
+    with _categories_lock:
+        if _categories is None:
+            _categories = CategoryCache()
+    return _categories
+
+@receiver(setting_changed)
+def reset_category_cache(**kwargs):
+    global _categories
+    if kwargs['setting'].startswith('RANGO_CATEGORY_CACHE'):
+        _categories = None
+
+def get_category(slug, request=None):
+    '''
+        The category with this slug, or None.
+    '''
+    return get_category_cache().get(slug, request)
+
+def invalidate_categories():
+    get_category_cache().invalidate()
+
+
+PROFILES_VERSION_KEY = 'rango:profiles_version'
+
+def get_profiles_version():
+    '''
+        Part of the cache key for the rendered profile list, bumped whenever a profile or user changes.
+    '''
+    return caches['default'].get_or_set(PROFILES_VERSION_KEY, 1, None)
+
+def bump_profiles_version():
+    try:
+        caches['default'].incr(PROFILES_VERSION_KEY)
+    except ValueError:
+        caches['default'].set(PROFILES_VERSION_KEY, 1, None)
@@ -0,0 +1,64 @@
+import os
+import signal
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+SEARCH_KEY_ENV = 'BING_API_KEY'
+
+_search_key = None
+_search_key_lock = threading.Lock()
+
+
+def resolve_search_key():
+    '''
+        Looks for the search API key in settings, then the environment, then the key file.
+    '''
+    if settings.RANGO_SEARCH_KEY:
+        return settings.RANGO_SEARCH_KEY
+
+    if os.environ.get(SEARCH_KEY_ENV):
+        return os.environ[SEARCH_KEY_ENV].strip()
+
+    try:
+        with open(settings.RANGO_SEARCH_KEY_FILE, 'r') as f:
+            return f.readline().strip() or None
+    except OSError:
+        return None
+
+def load_search_key():
+    global _search_key
+    with _search_key_lock:
+        _search_key = resolve_search_key()
+    return _search_key
+
+def get_search_key():
+    key = _search_key or load_search_key()
+    if not key:
+        raise ImproperlyConfigured(f'No search API key found in settings.RANGO_SEARCH_KEY, '
+                                   f'${SEARCH_KEY_ENV} or {settings.RANGO_SEARCH_KEY_FILE}.')
+    return key
+
+def reload_search_key(*args):
+    load_search_key()
+
+def setup_search_key():
+    '''
+        Called once from RangoConfig.ready.
+    '''
+    if not load_search_key() and settings.RANGO_SEARCH_KEY_REQUIRED:
+        get_search_key()
+
+    # e.g. kill -HUP picks up a new key without a restart, only where asked for - the server may use the signal itself
+    reload_signal = getattr(signal, settings.RANGO_SEARCH_KEY_RELOAD_SIGNAL or '', None)
+    if reload_signal is not None and threading.current_thread() is threading.main_thread():
+        signal.signal(reload_signal, reload_search_key)
+
+@receiver(setting_changed)
+def reset_search_key(**kwargs):
+    global _search_key
+    if kwargs['setting'].startswith('RANGO_SEARCH_KEY'):
+        _search_key = None
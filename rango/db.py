@@ -0,0 +1,51 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# set while a read-only view runs, see ReplicaMiddleware
+use_replica = ContextVar('rango_use_replica', default=False)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    '''
+        SQLite settings that only last as long as the connection, so they're
+        applied to every new one (WAL itself sticks to the file once set).
+    '''
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.RANGO_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+class ReplicaRouter(object):
+    '''
+        Sends rango's reads to one of RANGO_DB_REPLICAS while a read-only view
+        is running, and everything else (including every write) to default.
+
+        Only rango's own models are routed, so sessions and users are always
+        read from the primary and a fresh login is never lost to replica lag.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'rango' or not use_replica.get():
+            return None
+        replicas = settings.RANGO_DB_REPLICAS
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        # read our own writes for the rest of the request
+        use_replica.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get their schema from the primary
+        return db not in settings.RANGO_DB_REPLICAS
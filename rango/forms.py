@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from rango.models import Page, Category, UserProfile
+from rango.url_normalization import url_hash
 
 class CategoryForm(forms.ModelForm):
     name = forms.CharField(max_length=Category.max_length_char, help_text="Please enter the category name.")
@@ -28,17 +29,41 @@ class PageForm(forms.ModelForm):
 
         # we need either a fields or exclude line
 
+    def __init__(self, *args, **kwargs):
+        # url hashes already taken, for checking many forms against one lookup (see rango.loader.add_pages)
+        self.taken_hashes = kwargs.pop('taken_hashes', None)
+        super(PageForm, self).__init__(*args, **kwargs)
+
     def clean(self):
         cleaned_data = self.cleaned_data
         url = cleaned_data.get('url')
 
-        # if url not empty and doesn't begin with http:// we add it
-        if url and not url.startswith('http://'):
+        # if url not empty and doesn't begin with http:// (or https://) we add it
+        if url and not url.startswith(('http://', 'https://')):
             url = f'http://{url}'
             cleaned_data['url'] = url
 
+        # the url is kept as given, pages are compared by its canonical form
+        # one lookup on the unique url_hash index
+        if url:
+            if self.is_duplicate(url_hash(url)):
+                self.add_error('url', Page.duplicate_url_message)
+
         return cleaned_data
 
+    def validate_unique(self):
+        # clean() has checked the url already (against taken_hashes when given), don't look it up twice
+        exclude = self._get_validation_exclusions() + ['url']
+        try:
+            self.instance.validate_unique(exclude=exclude)
+        except forms.ValidationError as e:
+            self._update_errors(e)
+
+    def is_duplicate(self, hashed):
+        if self.taken_hashes is not None:
+            return hashed in self.taken_hashes
+        return Page.objects.filter(url_hash=hashed).exclude(pk=self.instance.pk).exists()
+
 class UserForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput())
 
@@ -0,0 +1,77 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from rango.caching import bump_profiles_version
+from rango.tasks import task
+
+# resized pictures are kept here, named after their content so they can be cached forever
+VARIANTS_DIR = 'profile_images/variants'
+
+
+def variant_name(picture_name, variant, content):
+    stem = os.path.splitext(os.path.basename(picture_name))[0]
+    digest = hashlib.sha1(content).hexdigest()[:16]
+    extension = settings.RANGO_IMAGE_FORMAT.lower()
+    return f'{VARIANTS_DIR}/{stem}.{variant}.{digest}.{extension}'
+
+def resize(image, size):
+    '''
+        Crops to the variant's shape from the centre and scales down, re-encoded
+        in RANGO_IMAGE_FORMAT. Returns the encoded bytes.
+    '''
+    # respect the camera's orientation, then drop everything but the pixels
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    image = ImageOps.fit(image, size, Image.LANCZOS)
+
+    out = BytesIO()
+    image.save(out, settings.RANGO_IMAGE_FORMAT, quality=settings.RANGO_IMAGE_QUALITY, method=6)
+    return out.getvalue()
+
+@task(max_attempts=3)
+def make_variants(profile_id):
+    '''
+        Writes every variant of a profile's picture and stores their names on
+        the profile. Returns variant -> name, empty if there's no picture.
+    '''
+    from rango.models import UserProfile
+
+    profile = UserProfile.objects.filter(id=profile_id).only('id', 'picture').first()
+    if profile is None or not profile.picture:
+        return {}
+
+    names = {}
+    with profile.picture.open('rb') as f, Image.open(f) as image:
+        image.load()
+        for variant, size in settings.RANGO_IMAGE_VARIANTS.items():
+            content = resize(image, size)
+            name = variant_name(profile.picture.name, variant, content)
+            # the same content always gets the same name, so there's nothing to do if it exists
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(content))
+            names[variant] = name
+
+    # only if the picture hasn't been replaced while we were working
+    updated = UserProfile.objects.filter(id=profile_id, picture=profile.picture.name).update(
+        **{f'picture_{variant}': name for variant, name in names.items()})
+    if updated:
+        bump_profiles_version()
+    return names
+
+
+def clear_variants(profile):
+    # the old picture's variants no longer apply, the original is shown until the new ones are ready
+    for variant in settings.RANGO_IMAGE_VARIANTS:
+        setattr(profile, f'picture_{variant}', '')
+
+def generate_variants_later(profile):
+    '''
+        Queues the profile's picture to be resized by a worker, so the upload
+        request doesn't wait for it. Until then the original is shown.
+    '''
+    return make_variants.enqueue(profile.id, key=f'picture_variants:{profile.id}')
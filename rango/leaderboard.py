@@ -0,0 +1,99 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from rango.models import Category, Page
+
+
+class Leaderboard(object):
+    '''
+        Top-N list kept in the cache and updated as scores change, so the
+        homepage never has to sort the whole table.
+
+        Scores only ever go up through the normal paths (views, likes), so an
+        item can only enter the list by beating the current minimum. Anything
+        else (a score going down, a member being deleted) just drops the list
+        and it is rebuilt from the database on the next read.
+    '''
+
+    def __init__(self, name, model, score_field, fields):
+        self.name = name
+        self.model = model
+        self.score_field = score_field
+        self.fields = fields
+        self.lock = threading.Lock()
+
+    @property
+    def key(self):
+        return f'rango:leaderboard:{self.name}'
+
+    @property
+    def size(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_TIMEOUT', 600)
+
+    def entry(self, values):
+        entry = {field: values[field] for field in self.fields}
+        entry['id'] = values['id']
+        entry['score'] = values[self.score_field]
+        return entry
+
+    def rebuild(self):
+        rows = self.model.objects.order_by(f'-{self.score_field}', 'id').values('id', self.score_field, *self.fields)
+        entries = [self.entry(row) for row in rows[:self.size]]
+        cache.set(self.key, entries, self.timeout)
+        return entries
+
+    def entries(self):
+        entries = cache.get(self.key)
+        if entries is None:
+            entries = self.rebuild()
+        return entries
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+    def update(self, values):
+        '''
+            values is a dict with id, the score field and the display fields of one item.
+        '''
+        with self.lock:
+            entries = cache.get(self.key)
+            if entries is None:
+                # nothing cached, the next read will rebuild it anyway
+                return
+
+            new = self.entry(values)
+            for i, current in enumerate(entries):
+                if current['id'] == new['id']:
+                    if new['score'] < current['score']:
+                        # it may have dropped out of the top N, we can't tell from here
+                        self.invalidate()
+                        return
+                    entries[i] = new
+                    break
+            else:
+                if len(entries) >= self.size and new['score'] <= entries[-1]['score']:
+                    return
+                entries.append(new)
+
+            entries.sort(key=lambda e: (-e['score'], e['id']))
+            cache.set(self.key, entries[:self.size], self.timeout)
+
+    def discard(self, item_id):
+        entries = cache.get(self.key)
+        if entries is not None and any(e['id'] == item_id for e in entries):
+            self.invalidate()
+
+
+categories = Leaderboard('categories', Category, 'likes', ('name', 'slug'))
+pages = Leaderboard('pages', Page, 'views', ('title', 'url'))
+
+def top_categories():
+    return categories.entries()
+
+def top_pages():
+    return pages.entries()
@@ -0,0 +1,95 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import Signal, receiver
+from rango.metrics import registry
+from rango.models import Category, CategoryLike
+from rango.tasks import task
+
+# sent after likes are added to their categories
+# counts maps category id -> number of likes added
+likes_compacted = Signal(providing_args=['counts'])
+
+
+
+class CompactionConflict(Exception):
+    '''
+        Another compaction added some of the same likes first, nothing was written.
+    '''
+    pass
+
+def like_category(user, category):
+    '''
+        Records a like, returns False if the user already liked this category.
+
+        A like is a single INSERT into the like log, so a burst of likes on one
+        category never queues up behind a lock on its row. The log is added to
+        Category.likes in batches by a compact_pending_likes job, queued to run
+        RANGO_LIKE_COMPACT_INTERVAL seconds after the first like it will pick up.
+    '''
+    try:
+        with transaction.atomic():
+            CategoryLike.objects.create(user=user, category=category)
+    except IntegrityError:
+        return False
+
+    compact_pending_likes.enqueue(key='compact_likes', delay=settings.RANGO_LIKE_COMPACT_INTERVAL)
+    return True
+
+def pending_likes(category):
+    return CategoryLike.objects.filter(category=category, compacted=False).count()
+
+def compact_likes():
+    '''
+        Adds every pending like to its category, returns category id -> likes added.
+
+        Raises CompactionConflict if another compaction (e.g. the management
+        command, or a second worker) took some of them in the meantime.
+    '''
+    pending = list(CategoryLike.objects.filter(compacted=False).values_list('id', 'category_id'))
+    if not pending:
+        return {}
+
+    counts = Counter(category_id for like_id, category_id in pending)
+
+    with transaction.atomic():
+        # marking them first takes the write lock up front, and tells us if anyone else got there first
+        marked = CategoryLike.objects.filter(id__in=[like_id for like_id, category_id in pending],
+                                             compacted=False).update(compacted=True)
+        if marked != len(pending):
+            raise CompactionConflict(f'{len(pending) - marked} of {len(pending)} likes were already compacted.')
+
+        # group categories by increment so a compaction is only a handful of UPDATEs
+        by_increment = {}
+        for category_id, n in counts.items():
+            by_increment.setdefault(n, []).append(category_id)
+        for n, category_ids in by_increment.items():
+            Category.objects.filter(id__in=category_ids).update(likes=F('likes') + n)
+
+    likes_compacted.send(sender=CategoryLike, counts=dict(counts))
+    return dict(counts)
+
+@task(max_attempts=3, retry_delay=1)
+def compact_pending_likes():
+    # a conflict rolls back, and the retry picks up whatever is still pending
+    return sum(compact_likes().values())
+
+
+# totals for /metrics, kept up to date through the compaction signal
+compact_totals = {'compactions': 0, 'likes': 0}
+
+@receiver(likes_compacted)
+def count_compaction(sender, counts, **kwargs):
+    compact_totals['compactions'] = compact_totals['compactions'] + 1
+    compact_totals['likes'] = compact_totals['likes'] + sum(counts.values())
+
+@registry.register
+def likes_metrics():
+    return [
+        ('rango_like_compactions_total', 'counter', 'Batches of likes added to their categories.',
+         [({}, compact_totals['compactions'])]),
+        ('rango_likes_compacted_total', 'counter', 'Likes added to their categories.',
+         [({}, compact_totals['likes'])]),
+    ]
@@ -0,0 +1,318 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.template.defaultfilters import slugify
+from rango import aggregates, leaderboard, search_index
+from rango.caching import invalidate_page_url, invalidate_categories
+from rango.forms import PageForm
+from rango.response_cache import INDEX, SIDEBAR, bump_generation, bump_versions, category_scope
+from rango.models import Category, Page
+from rango.templatetags.rango_template_tags import invalidate_sidebar_categories
+from rango.url_normalization import url_hash
+
+# CSV files have one page per row, or just a category if title is left empty
+CSV_FIELDS = ('category', 'title', 'url', 'views', 'category_views', 'category_likes')
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    if reader.fieldnames is None or 'category' not in reader.fieldnames:
+        raise ValueError(f'CSV header needs a category column, and optionally {", ".join(CSV_FIELDS[1:])}')
+    yield from reader
+
+def read_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def read_page_rows(body, content_type):
+    '''
+        Rows of {title, url, views} from a JSON list (or {"pages": [...]}) or a CSV with a header.
+    '''
+    if content_type == 'text/csv':
+        reader = csv.DictReader(io.StringIO(body))
+        if reader.fieldnames is None or not {'title', 'url'} <= set(reader.fieldnames):
+            raise ValueError('CSV header needs title and url columns, and optionally views')
+        return list(reader)
+
+    rows = json.loads(body)
+    if isinstance(rows, dict):
+        rows = rows.get('pages')
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError('Expected a list of pages, each with a title and url')
+    return rows
+
+def to_int(value):
+    return int(value) if value not in (None, '') else None
+
+def taken_hashes(hashes):
+    '''
+        url hash -> id of the page that has it, for the hashes already in use.
+    '''
+    hashes = list(hashes)
+    taken = {}
+    for i in range(0, len(hashes), 500):
+        taken.update(Page.objects.filter(url_hash__in=hashes[i:i + 500]).values_list('url_hash', 'id'))
+    return taken
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Loader(object):
+    '''
+        Writes categories and pages with bulk inserts and updates, one
+        transaction per batch, so only one batch is ever held in memory.
+
+        Categories are matched on name and pages on (category, title), like
+        populate_rango.py's get_or_create calls, so loading the same file
+        twice leaves the database unchanged. A page whose url (once
+        canonicalized) already belongs to another page is skipped.
+    '''
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = {}
+        self.touched = set()
+        self.stats = {'rows': 0, 'categories_created': 0, 'categories_updated': 0,
+                      'pages_created': 0, 'pages_updated': 0, 'skipped': 0, 'duplicates': 0}
+
+    def load(self, rows, progress=None):
+        start = time.time()
+
+        for batch in batches(rows, self.batch_size):
+            with transaction.atomic():
+                categories = self.load_categories(batch)
+                self.load_pages(batch, categories)
+            self.touched.update(categories.values())
+            self.stats['rows'] = self.stats['rows'] + len(batch)
+            if progress:
+                progress(self.stats, time.time() - start)
+
+        self.finish()
+        self.stats['seconds'] = time.time() - start
+        return self.stats
+
+    def load_categories(self, batch):
+        wanted = {}
+        for row in batch:
+            name = (row.get('category') or '').strip()
+            if not name:
+                continue
+            values = wanted.setdefault(name, {})
+            if to_int(row.get('category_views')) is not None:
+                values['views'] = to_int(row.get('category_views'))
+            if to_int(row.get('category_likes')) is not None:
+                values['likes'] = to_int(row.get('category_likes'))
+
+        # categories already seen by this load are remembered, so most batches don't need to look them up
+        unknown = [name for name in wanted if name not in self.categories]
+        self.categories.update(Category.objects.in_bulk(unknown, field_name='name'))
+        existing = {name: self.categories[name] for name in wanted if name in self.categories}
+
+        # slugs are worked out here, bulk_create doesn't call Category.save
+        new = [Category(name=name, slug=slugify(name), **values)
+               for name, values in wanted.items() if name not in existing]
+        Category.objects.bulk_create(new, ignore_conflicts=True)
+
+        changed = []
+        for name, values in wanted.items():
+            category = existing.get(name)
+            if category and any(getattr(category, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(category, field, value)
+                changed.append(category)
+        if changed:
+            Category.objects.bulk_update(changed, ['views', 'likes'])
+            self.stats['categories_updated'] = self.stats['categories_updated'] + len(changed)
+
+        if new:
+            created = Category.objects.filter(name__in=[c.name for c in new])
+            self.categories.update((category.name, category) for category in created)
+            self.stats['categories_created'] = self.stats['categories_created'] + len(created)
+
+        return {name: self.categories[name].id for name in wanted if name in self.categories}
+
+    def load_pages(self, batch, categories):
+        wanted = {}
+        for row in batch:
+            title = (row.get('title') or '').strip()
+            if not title:
+                continue
+            category_id = categories.get((row.get('category') or '').strip())
+            if category_id is None:
+                # the category couldn't be created, e.g. its slug clashes with another name
+                self.stats['skipped'] = self.stats['skipped'] + 1
+                continue
+            wanted[(category_id, title)] = {'url': row.get('url') or '', 'views': to_int(row.get('views')) or 0}
+
+        # look pages up by title alone (one index probe each), the category is checked here
+        existing = {}
+        titles = {title for category_id, title in wanted}
+        for page in Page.objects.filter(title__in=titles):
+            if (page.category_id, page.title) in wanted:
+                existing[(page.category_id, page.title)] = page
+
+        # a url can only belong to one page, rows pointing at a url some other page has are skipped
+        hashes = {key: url_hash(values['url']) for key, values in wanted.items()}
+        taken = taken_hashes(set(hashes.values()))
+
+        new = []
+        changed = []
+        for (category_id, title), values in wanted.items():
+            page = existing.get((category_id, title))
+            hashed = hashes[(category_id, title)]
+            owner = taken.get(hashed)
+            if owner is not None and (page is None or owner != page.id):
+                self.stats['duplicates'] = self.stats['duplicates'] + 1
+                continue
+            taken[hashed] = page.id if page else (category_id, title)
+
+            if page is None:
+                new.append(Page(category_id=category_id, title=title, url_hash=hashed, **values))
+            elif page.url != values['url'] or page.views != values['views']:
+                page.url = values['url']
+                page.url_hash = hashed
+                page.views = values['views']
+                changed.append(page)
+
+        Page.objects.bulk_create(new)
+        if changed:
+            Page.objects.bulk_update(changed, ['url', 'url_hash', 'views'])
+            for page in changed:
+                invalidate_page_url(page.id)
+        self.stats['pages_created'] = self.stats['pages_created'] + len(new)
+        self.stats['pages_updated'] = self.stats['pages_updated'] + len(changed)
+
+    def finish(self):
+        # bulk writes skip the model signals, so bring the derived data up to date in one go
+        aggregates.reconcile(self.touched)
+        # only the categories this load wrote to, the rest of the index is still right
+        search_index.index_categories(self.touched)
+        leaderboard.categories.invalidate()
+        leaderboard.pages.invalidate()
+        invalidate_sidebar_categories()
+        invalidate_categories()
+        bump_generation()
+
+
+def add_pages(category, rows):
+    '''
+        Adds every valid row to the category with a single bulk_create, checked
+        by PageForm just like AddPageView. Returns (pages created, errors) where
+        errors is a list of {'row': index, 'errors': {field: [messages]}}.
+
+        New pages start with no views whatever the rows say, as with AddPageView,
+        so nobody can put their pages straight onto the leaderboard.
+    '''
+    # look every url up at once, rather than a query per form
+    hashes = set()
+    for row in rows:
+        try:
+            hashes.add(url_hash(str(row.get('url') or '')))
+        except ValueError:
+            pass
+    taken = set(taken_hashes(hashes))
+
+    pages = []
+    errors = []
+    row_of = {}
+    for i, row in enumerate(rows):
+        form = PageForm({'title': row.get('title'), 'url': row.get('url'), 'views': 0}, taken_hashes=taken)
+        if form.is_valid():
+            page = form.save(commit=False)
+            page.category = category
+            page.views = 0
+            page.url_hash = url_hash(page.url)
+            # the same url twice in one batch only gets added once
+            taken.add(page.url_hash)
+            pages.append(page)
+            row_of[page.url_hash] = i
+        else:
+            errors.append({'row': i, 'errors': form.errors.get_json_data()})
+
+    while pages:
+        try:
+            with transaction.atomic():
+                Page.objects.bulk_create(pages)
+                # bulk_create skips the signals, so catch the category totals and search index up here,
+                # touching only the new rows so a batch costs the same however big the category is
+                aggregates.adjust(category.id, pages=len(pages))
+                if search_index.use_fts():
+                    # bulk_create doesn't hand back ids on SQLite, find them by their url hashes
+                    search_index.index_pages(taken_hashes(page.url_hash for page in pages).values())
+            break
+        except IntegrityError:
+            # another request added some of the same urls since we looked, leave those out and try again
+            added = set(taken_hashes(page.url_hash for page in pages))
+            if not added:
+                raise
+            for hashed in added:
+                errors.append({'row': row_of[hashed], 'errors': {'url': [{'message': Page.duplicate_url_message,
+                                                                          'code': ''}]}})
+            pages = [page for page in pages if page.url_hash not in added]
+    errors.sort(key=lambda error: error['row'])
+
+    if pages:
+        invalidate_categories()
+        invalidate_sidebar_categories()
+        bump_versions(INDEX, SIDEBAR, category_scope(category.slug))
+
+    return pages, errors
+
+def dedupe_pages():
+    '''
+        Merges pages that share a canonical url into the oldest of them, adding
+        their views to it, and fills in url_hash for every page that's left.
+        Returns (pages merged away, pages rehashed).
+    '''
+    keepers = {}
+    merged = {}
+    rehash = []
+
+    for page_id, url, stored, views in Page.objects.order_by('id').values_list('id', 'url', 'url_hash', 'views').iterator():
+        hashed = url_hash(url)
+        keeper = keepers.get(hashed)
+        if keeper is None:
+            keepers[hashed] = page_id
+            if stored != hashed:
+                rehash.append((page_id, hashed))
+        else:
+            merged.setdefault(keeper, []).append((page_id, views))
+
+    with transaction.atomic():
+        duplicates = [page_id for pages in merged.values() for page_id, views in pages]
+        for i in range(0, len(duplicates), 500):
+            # a normal delete, so the signals take the pages out of the totals, search index and caches
+            for page in Page.objects.filter(id__in=duplicates[i:i + 500]):
+                page.delete()
+
+        for keeper, pages in merged.items():
+            views = sum(views for page_id, views in pages)
+            if views:
+                Page.objects.filter(id=keeper).update(views=F('views') + views)
+                aggregates.adjust(Page.objects.values_list('category_id', flat=True).get(id=keeper), 0, views)
+                invalidate_page_url(keeper)
+
+        # clear first, so two pages swapping hashes never trip the unique index
+        rehashed = [page_id for page_id, hashed in rehash]
+        for i in range(0, len(rehashed), 500):
+            Page.objects.filter(id__in=rehashed[i:i + 500]).update(url_hash=None)
+        for page_id, hashed in rehash:
+            Page.objects.filter(id=page_id).update(url_hash=hashed)
+
+    if merged:
+        leaderboard.pages.invalidate()
+        bump_generation()
+    return len(duplicates), len(rehash)
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rango import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Fill a throwaway test database with synthetic categories, pages and users, '
+            'then time every rango url and report latency percentiles, throughput and query counts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=100, help='requests per url')
+        parser.add_argument('--warmup', type=int, default=5, help='untimed requests per url first')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='save the results as JSON here')
+        parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        spool_dir = tempfile.mkdtemp()
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            with override_settings(RANGO_VIEW_SPOOL=os.path.join(spool_dir, 'page_views.spool')):
+                start = time.time()
+                cats = benchmark.generate(options['categories'], options['pages'], options['seed'])
+                benchmark.load(cats, options['users'])
+                self.stdout.write(f'Loaded {options["categories"]} categories, {options["pages"]} pages '
+                                  f'and {options["users"]} users in {time.time() - start:.1f}s')
+
+                results = {
+                    'anonymous': benchmark.run(options['requests'], options['warmup']),
+                    'logged_in': benchmark.run(options['requests'], options['warmup'], username='user0'),
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(spool_dir)
+
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)['results']
+
+        for client, urls in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(client))
+            self.stdout.write(f'  {"view":<28} {"status":>6} {"p50":>8} {"p95":>8} {"p99":>8} {"req/s":>8} {"queries":>8}')
+            for name, r in urls.items():
+                line = (f'  {name:<28} {r["status"]:>6} {r["p50_ms"]:>8.2f} {r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} '
+                        f'{r["throughput_rps"]:>8.0f} {r["queries_mean"]:>8.1f}')
+                before = previous and previous.get(client, {}).get(name)
+                if before:
+                    line = line + f'   p95 {before["p95_ms"]:.2f} -> {r["p95_ms"]:.2f}'
+                self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'meta': {
+                        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'categories': options['categories'],
+                        'pages': options['pages'],
+                        'users': options['users'],
+                        'requests': options['requests'],
+                    },
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(f'Saved results to {options["output"]}')
@@ -0,0 +1,127 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from rango.models import Category, Page
+from rango.pagination import PAGE_ORDERING
+
+ALIAS = 'rango_benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway SQLite database with lots of pages and compare query plans '
+            'and latencies for the hot rango queries with and without the model indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1000000)
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20, help='runs per query, the median is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        tmp_dir = tempfile.mkdtemp()
+        connections.databases[ALIAS] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tmp_dir, 'benchmark.sqlite3'),
+        }
+
+        try:
+            self.create_tables()
+            self.seed(options['categories'], options['pages'], options['seed'])
+            category_id = random.Random(options['seed']).randint(1, options['categories'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+            before = self.run_queries(category_id, options['repeat'])
+
+            self.add_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            after = self.run_queries(category_id, options['repeat'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+            for name in before:
+                self.stdout.write(f'  {name:<20} {before[name]:>10.2f} -> {after[name]:>8.2f}')
+        finally:
+            connections[ALIAS].close()
+            del connections.databases[ALIAS]
+            shutil.rmtree(tmp_dir)
+
+    def create_tables(self):
+        with connections[ALIAS].schema_editor() as editor:
+            for model in (Category, Page):
+                editor.create_model(model)
+
+        # start from the old schema, without the indexes declared in Meta
+        with connections[ALIAS].schema_editor() as editor:
+            for model in (Category, Page):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def add_indexes(self):
+        start = time.time()
+        with connections[ALIAS].schema_editor() as editor:
+            for model in (Category, Page):
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Built indexes in {time.time() - start:.1f}s')
+
+    def seed(self, n_categories, n_pages, seed):
+        rng = random.Random(seed)
+        start = time.time()
+        connection = connections[ALIAS]
+
+        with transaction.atomic(using=ALIAS), connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO rango_category (id, name, slug, views, likes, page_count, total_views) '
+                'VALUES (%s, %s, %s, %s, %s, 0, 0)',
+                [(i, f'Category {i}', f'category-{i}', rng.randint(0, 10000), rng.randint(0, 10000))
+                 for i in range(1, n_categories + 1)])
+
+            batch_size = 50000
+            for offset in range(0, n_pages, batch_size):
+                cursor.executemany(
+                    'INSERT INTO rango_page (category_id, title, url, views) VALUES (%s, %s, %s, %s)',
+                    [(rng.randint(1, n_categories), f'Page {i}', f'http://example.com/{i}/', rng.randint(0, 100000))
+                     for i in range(offset, min(offset + batch_size, n_pages))])
+
+            # the totals the signals would have kept up to date
+            cursor.execute(
+                'UPDATE rango_category SET '
+                'page_count = (SELECT COUNT(*) FROM rango_page WHERE category_id = rango_category.id), '
+                'total_views = (SELECT COALESCE(SUM(views), 0) FROM rango_page WHERE category_id = rango_category.id)')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f'Seeded {n_categories} categories and {n_pages} pages in {time.time() - start:.1f}s')
+
+    def queries(self, category_id):
+        return {
+            'top categories': Category.objects.using(ALIAS).order_by('-likes')[:5],
+            'top pages': Page.objects.using(ALIAS).order_by('-views')[:5],
+            'category pages': Page.objects.using(ALIAS).filter(category_id=category_id).order_by(*PAGE_ORDERING)[:50],
+        }
+
+    def run_queries(self, category_id, repeat):
+        results = {}
+
+        for name, queryset in self.queries(category_id).items():
+            timings = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            results[name] = timings[len(timings) // 2]
+
+            self.stdout.write(f'{name}: {results[name]:.2f}ms')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+        return results
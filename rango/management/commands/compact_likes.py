@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from rango.likes import CompactionConflict, compact_likes
+
+
+class Command(BaseCommand):
+    help = 'Add pending likes from the like log to their categories.'
+
+    def handle(self, *args, **options):
+        try:
+            counts = compact_likes()
+        except CompactionConflict as e:
+            raise CommandError(f'{e} Run it again to add the rest.')
+        self.stdout.write(f'Compacted {sum(counts.values())} likes across {len(counts)} categories.')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from rango.loader import dedupe_pages
+
+
+class Command(BaseCommand):
+    help = 'Merge pages with the same canonical URL, adding up their views, and fill in missing URL hashes.'
+
+    def handle(self, *args, **options):
+        merged, rehashed = dedupe_pages()
+        self.stdout.write(f'Merged {merged} duplicate pages, hashed {rehashed} URLs.')
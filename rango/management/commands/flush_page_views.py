@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from rango.view_counter import flush_page_views
+
+
+class Command(BaseCommand):
+    help = 'Write buffered page views from the spool file to the database.'
+
+    def handle(self, *args, **options):
+        counts = flush_page_views()
+        self.stdout.write(f'Flushed {sum(counts.values())} views across {len(counts)} pages.')
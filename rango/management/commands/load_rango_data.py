@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from rango.loader import Loader, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Bulk load categories and pages from a CSV or JSONL file. '
+            'Rows are matched on category name and page title, so re-running a file is safe.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='a .csv or .jsonl file')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+
+        def progress(stats, seconds):
+            self.stdout.write(f'{stats["rows"]} rows, {stats["rows"] / max(seconds, 1e-6):.0f} rows/s')
+
+        try:
+            with open(path, newline='') as f:
+                rows = read_csv(f) if file_format == 'csv' else read_jsonl(f)
+                stats = Loader(options['batch_size']).load(rows, progress if options['verbosity'] > 1 else None)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f'Loaded {stats["rows"]} rows in {stats["seconds"]:.1f}s '
+            f'({stats["rows"] / max(stats["seconds"], 1e-6):.0f} rows/s): '
+            f'{stats["categories_created"]} categories created, {stats["categories_updated"]} updated, '
+            f'{stats["pages_created"]} pages created, {stats["pages_updated"]} updated, {stats["skipped"]} skipped.')
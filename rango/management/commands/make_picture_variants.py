@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from rango.images import make_variants
+from rango.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Resize profile pictures that have no variants yet (or all of them with --all).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Redo pictures that already have variants.')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(picture='')
+        if not options['all']:
+            profiles = profiles.filter(picture_thumbnail='')
+
+        done = 0
+        for profile_id in profiles.values_list('id', flat=True).iterator():
+            if make_variants(profile_id):
+                done = done + 1
+        self.stdout.write(f'Resized pictures for {done} profiles.')
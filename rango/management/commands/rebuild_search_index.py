@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rango import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the local full text search index over categories and pages.'
+
+    def handle(self, *args, **options):
+        if not search_index.use_fts():
+            raise CommandError('The search index needs SQLite FTS5, other databases are searched directly.')
+
+        start = time.time()
+        rows = search_index.rebuild()
+        self.stdout.write(f'Indexed {rows} categories and pages in {time.time() - start:.2f}s.')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from rango.aggregates import reconcile
+from rango.caching import invalidate_categories
+from rango.response_cache import bump_generation
+from rango.templatetags.rango_template_tags import invalidate_sidebar_categories
+
+
+class Command(BaseCommand):
+    help = 'Recount each category\'s page_count and total_views from its pages, fixing any drift.'
+
+    def handle(self, *args, **options):
+        drifted = reconcile()
+        if drifted:
+            invalidate_categories()
+            invalidate_sidebar_categories()
+            bump_generation()
+        self.stdout.write(f'Fixed the totals of {drifted} categories.')
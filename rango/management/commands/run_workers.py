@@ -0,0 +1,28 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rango.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the queue until stopped (or until it is empty with --once).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.RANGO_TASK_CONCURRENCY,
+                            help='Jobs to run at the same time.')
+        parser.add_argument('--once', action='store_true', help='Stop once there are no jobs left to run.')
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'])
+
+        if not options['once']:
+            # finish the jobs already running, then exit
+            signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+            self.stdout.write(f'Running jobs, {worker.concurrency} at a time.')
+
+        try:
+            worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write('Workers stopped.')
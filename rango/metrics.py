@@ -0,0 +1,134 @@
+import threading
+from collections import defaultdict
+
+# upper bounds (seconds) for the request latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats(object):
+    '''
+        What one request cost, filled in while it runs.
+    '''
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+
+class ViewMetrics(object):
+    def __init__(self):
+        self.requests = 0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.latency = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.budget_exceeded = 0
+
+
+class Registry(object):
+    '''
+        Per-view totals for this process, plus collectors that other parts of
+        rango register to add their own lines to the /metrics output.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+        self.collectors = []
+        self.local = threading.local()
+
+    # the stats for the request running on this thread, if any
+    @property
+    def current(self):
+        return getattr(self.local, 'stats', None)
+
+    def start_request(self):
+        self.local.stats = RequestStats()
+        return self.local.stats
+
+    def end_request(self):
+        self.local.stats = None
+
+    def add_template_time(self, seconds):
+        stats = self.current
+        if stats is not None:
+            stats.template_time = stats.template_time + seconds
+
+    def record(self, view_name, stats, latency, over_budget=False):
+        with self.lock:
+            metrics = self.views[view_name]
+            metrics.requests = metrics.requests + 1
+            metrics.sql_count = metrics.sql_count + stats.sql_count
+            metrics.sql_time = metrics.sql_time + stats.sql_time
+            metrics.template_time = metrics.template_time + stats.template_time
+            metrics.latency = metrics.latency + latency
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    metrics.buckets[i] = metrics.buckets[i] + 1
+            if over_budget:
+                metrics.budget_exceeded = metrics.budget_exceeded + 1
+
+    def register(self, collector):
+        '''
+            collector() returns a list of (name, type, help, [(labels dict, value), ...]).
+        '''
+        self.collectors.append(collector)
+        return collector
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def families(self):
+        with self.lock:
+            views = sorted(self.views.items())
+
+        families = [
+            ('rango_requests_total', 'counter', 'Requests handled, by view.',
+             [({'view': name}, m.requests) for name, m in views]),
+            ('rango_sql_queries_total', 'counter', 'SQL queries run, by view.',
+             [({'view': name}, m.sql_count) for name, m in views]),
+            ('rango_sql_seconds_total', 'counter', 'Time spent in SQL queries, by view.',
+             [({'view': name}, m.sql_time) for name, m in views]),
+            ('rango_template_seconds_total', 'counter', 'Time spent rendering templates, by view.',
+             [({'view': name}, m.template_time) for name, m in views]),
+            ('rango_query_budget_exceeded_total', 'counter', 'Requests that ran more queries than their budget.',
+             [({'view': name}, m.budget_exceeded) for name, m in views]),
+        ]
+
+        histogram = []
+        for name, m in views:
+            for bound, count in zip(LATENCY_BUCKETS, m.buckets):
+                histogram.append(({'view': name, 'le': str(bound)}, count, '_bucket'))
+            histogram.append(({'view': name, 'le': '+Inf'}, m.requests, '_bucket'))
+            histogram.append(({'view': name}, m.latency, '_sum'))
+            histogram.append(({'view': name}, m.requests, '_count'))
+        families.append(('rango_request_duration_seconds', 'histogram', 'Request latency, by view.', histogram))
+
+        for collector in self.collectors:
+            families.extend(collector())
+
+        return families
+
+    def render(self):
+        '''
+            Everything in the Prometheus text exposition format.
+        '''
+        lines = []
+        for name, metric_type, help_text, samples in self.families():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ''
+                label_text = ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text else f'{name}{suffix} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+registry = Registry()
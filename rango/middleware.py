@@ -0,0 +1,84 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rango.db import use_replica
+from rango.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class ReplicaMiddleware(object):
+    '''
+        Lets ReplicaRouter send reads to a replica while one of
+        RANGO_REPLICA_VIEWS handles a GET, writes still go to the primary.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = use_replica.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in ('GET', 'HEAD') and request.resolver_match.view_name in settings.RANGO_REPLICA_VIEWS:
+            use_replica.set(True)
+
+
+class InstrumentationMiddleware(object):
+    '''
+        Records SQL count, SQL time, template render time and total latency for
+        every request against the name of the view that handled it, and checks
+        the query count against RANGO_QUERY_BUDGETS.
+
+        Put it first in MIDDLEWARE so the latency covers everything else.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = registry.start_request()
+        start = time.perf_counter()
+
+        def count_queries(execute, sql, params, many, context):
+            query_start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats.sql_count = stats.sql_count + 1
+                stats.sql_time = stats.sql_time + time.perf_counter() - query_start
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_queries))
+                response = self.get_response(request)
+        finally:
+            registry.end_request()
+
+        latency = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+
+        budget = settings.RANGO_QUERY_BUDGETS.get(view_name)
+        over_budget = budget is not None and stats.sql_count > budget
+        registry.record(view_name, stats, latency, over_budget)
+
+        if over_budget:
+            message = f'{view_name} ran {stats.sql_count} queries, its budget is {budget}'
+            if settings.RANGO_QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def create_search_index(apps, schema_editor):
+    # full text search needs SQLite built with FTS5, anything else falls back to icontains queries
+    if not has_fts5(schema_editor.connection):
+        return
+
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE rango_search_index USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, url, category, tokenize = 'porter unicode61')")
+    schema_editor.execute(
+        "INSERT INTO rango_search_index (kind, object_id, title, url, category) "
+        "SELECT 'category', id, name, '', name FROM rango_category")
+    schema_editor.execute(
+        "INSERT INTO rango_search_index (kind, object_id, title, url, category) "
+        "SELECT 'page', p.id, p.title, p.url, c.name FROM rango_page p "
+        "JOIN rango_category c ON c.id = p.category_id")
+
+
+def drop_search_index(apps, schema_editor):
+    if not has_fts5(schema_editor.connection):
+        return
+
+    schema_editor.execute("DROP TABLE IF EXISTS rango_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0005_auto_20261018_1704'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
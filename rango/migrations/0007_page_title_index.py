@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['title'], name='rango_page_title_idx'),
+        ),
+    ]
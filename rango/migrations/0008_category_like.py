@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rango', '0007_page_title_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryLike',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('compacted', models.BooleanField(default=False)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categorylike',
+            index=models.Index(fields=['compacted'], name='rango_categorylike_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categorylike',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='rango_categorylike_user_category_uniq'),
+        ),
+    ]
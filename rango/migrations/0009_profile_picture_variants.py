@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_category_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_medium',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+    ]
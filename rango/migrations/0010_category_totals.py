@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+def count_pages(apps, schema_editor):
+    # fill in the totals for the pages already there, from then on they're kept up to date as pages change
+    schema_editor.execute(
+        "UPDATE rango_category SET "
+        "page_count = (SELECT COUNT(*) FROM rango_page WHERE rango_page.category_id = rango_category.id), "
+        "total_views = (SELECT COALESCE(SUM(views), 0) FROM rango_page WHERE rango_page.category_id = rango_category.id)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='page_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_views',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_pages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:33
+
+from django.db import migrations, models
+from rango.url_normalization import url_hash
+
+
+def hash_urls(apps, schema_editor):
+    # the oldest page with each url gets the hash, any later duplicates are left null for dedupe_pages
+    Page = apps.get_model('rango', 'Page')
+    seen = set()
+    pages = []
+
+    for page in Page.objects.order_by('id').only('id', 'url').iterator():
+        page.url_hash = url_hash(page.url)
+        if page.url_hash not in seen:
+            seen.add(page.url_hash)
+            pages.append(page)
+        if len(pages) >= 500:
+            Page.objects.bulk_update(pages, ['url_hash'])
+            pages = []
+
+    Page.objects.bulk_update(pages, ['url_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0010_category_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='url_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(hash_urls, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.template.defaultfilters import slugify
+from rango.url_normalization import url_hash
 
 # Create your models here.
 class Category(models.Model):
@@ -10,25 +13,100 @@ class Category(models.Model):
     likes = models.IntegerField(default=0)
     slug = models.SlugField(unique=True)
 
+    # kept up to date from the pages by rango.aggregates, never edited directly
+    page_count = models.IntegerField(default=0, editable=False)
+    total_views = models.IntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # the totals move with F() updates, so saving an older copy mustn't write them back
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in ('page_count', 'total_views')]
         super(Category, self).save(*args, **kwargs)
 
     class Meta:
         verbose_name_plural = 'Categories'
+        indexes = [
+            # most liked categories on the homepage
+            models.Index(fields=['-likes'], name='rango_category_likes_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 class Page(models.Model):
+    duplicate_url_message = 'A page with this URL has already been added.'
+
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     title = models.CharField(max_length=Category.max_length_char)
     url = models.URLField()
     views = models.IntegerField(default=0)
+    # hash of the canonical url, so each page is only added once (see rango.url_normalization)
+    # null for duplicates that were already there, until dedupe_pages merges them
+    url_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Page, cls).from_db(db, field_names, values)
+        # remember what the category totals last counted, so a save can adjust them
+        instance.counted = dict(zip(field_names, values))
+        return instance
+
+    class Meta:
+        indexes = [
+            # pages of a category, most viewed first
+            models.Index(fields=['category', '-views'], name='rango_page_cat_views_idx'),
+            # most viewed pages on the homepage
+            models.Index(fields=['-views'], name='rango_page_views_idx'),
+            # finding existing pages by title when bulk loading
+            models.Index(fields=['title'], name='rango_page_title_idx'),
+        ]
+
+    def is_duplicate(self):
+        # pages from before url_hash that haven't been merged yet are let through, see save()
+        if self.pk is not None and self.url_hash is None:
+            return False
+        return Page.objects.filter(url_hash=url_hash(self.url)).exclude(pk=self.pk).exists()
+
+    def validate_unique(self, exclude=None):
+        super(Page, self).validate_unique(exclude)
+        # url_hash isn't on any form, so check it through the url (the admin relies on this)
+        if 'url' not in (exclude or []) and self.is_duplicate():
+            raise ValidationError({'url': [self.duplicate_url_message]})
+
+    def save(self, *args, **kwargs):
+        hashed = url_hash(self.url)
+        if self.pk is not None and self.url_hash is None and \
+                Page.objects.filter(url_hash=hashed).exclude(pk=self.pk).exists():
+            # a duplicate from before url_hash, leave it unhashed for dedupe_pages to merge
+            hashed = None
+        self.url_hash = hashed
+        super(Page, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
+class CategoryLike(models.Model):
+    # one row per like, added to Category.likes in batches by rango.likes.compact_likes
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # each user can like a category once
+            models.UniqueConstraint(fields=['user', 'category'], name='rango_categorylike_user_category_uniq'),
+        ]
+        indexes = [
+            # likes still waiting to be added to their category
+            models.Index(fields=['compacted'], name='rango_categorylike_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} likes {self.category}'
+
 class UserProfile(models.Model):
     # link UserProfile to User model instance
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -37,7 +115,40 @@ class UserProfile(models.Model):
     website = models.URLField(blank=True)
     picture = models.ImageField(upload_to='profile_images', blank=True)
 
+    # smaller copies of picture, made in the background by rango.images (see RANGO_IMAGE_VARIANTS)
+    picture_thumbnail = models.ImageField(blank=True, editable=False)
+    picture_medium = models.ImageField(blank=True, editable=False)
+
     def __str__(self):
         return self.user.username
 
+class Job(models.Model):
+    # a call to a function in the background, run by the workers in rango.tasks
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    name = models.CharField(max_length=200)                     # dotted path of the function
+    args = models.TextField(default='[]')                       # JSON list
+    key = models.CharField(max_length=200, null=True, blank=True)  # only one unfinished job per key
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    result = models.TextField(blank=True)                       # JSON
+    error = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # the next jobs for a worker to pick up
+            models.Index(fields=['status', 'run_after'], name='rango_job_ready_idx'),
+            models.Index(fields=['key'], name='rango_job_key_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
@@ -0,0 +1,93 @@
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# pages are listed most viewed first, ties broken by id so every row has a stable position
+PAGE_ORDERING = ('-views', 'id')
+
+
+def make_cursor(page):
+    return f'{page.views}_{page.id}'
+
+def parse_cursor(cursor):
+    '''
+        Turns "views_id" back into a tuple, or None if the cursor is missing or malformed.
+    '''
+    try:
+        views, page_id = cursor.split('_')
+        return int(views), int(page_id)
+    except (AttributeError, ValueError):
+        return None
+
+def seek(queryset, cursor):
+    '''
+        Pages that come after the cursor in PAGE_ORDERING.
+        Unlike OFFSET this is a single index range scan however deep we are.
+    '''
+    position = parse_cursor(cursor)
+    queryset = queryset.order_by(*PAGE_ORDERING)
+
+    if position is None:
+        return queryset
+
+    views, page_id = position
+    return queryset.filter(Q(views__lt=views) | Q(views=views, id__gt=page_id))
+
+def keyset_page(queryset, cursor, size):
+    '''
+        Returns (list of up to size pages, cursor for the next batch or None).
+    '''
+    # fetch one extra row to find out if there is anything after this batch
+    pages = list(seek(queryset, cursor)[:size + 1])
+
+    if len(pages) > size:
+        pages = pages[:size]
+        return pages, make_cursor(pages[-1])
+
+    return pages, None
+
+def iterate_pages(queryset, size):
+    '''
+        Every page in the queryset, fetched one keyset batch at a time.
+    '''
+    cursor = None
+    while True:
+        pages, cursor = keyset_page(queryset, cursor, size)
+        yield from pages
+        if cursor is None:
+            return
+
+
+class IdPage(object):
+    '''
+        One batch of a queryset in id order, starting after the id in cursor.
+        Nothing is queried until the template asks for the items, so a cached
+        fragment can skip the query altogether.
+    '''
+
+    def __init__(self, queryset, cursor, size):
+        self.queryset = queryset
+        try:
+            self.cursor = int(cursor)
+        except (TypeError, ValueError):
+            self.cursor = None
+        self.size = size
+
+    @cached_property
+    def batch(self):
+        queryset = self.queryset.order_by('id')
+        if self.cursor is not None:
+            queryset = queryset.filter(id__gt=self.cursor)
+
+        items = list(queryset[:self.size + 1])
+        if len(items) > self.size:
+            items = items[:self.size]
+            return items, items[-1].id
+        return items, None
+
+    @property
+    def items(self):
+        return self.batch[0]
+
+    @property
+    def next_cursor(self):
+        return self.batch[1]
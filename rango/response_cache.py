@@ -0,0 +1,120 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rango.metrics import registry
+
+# part of every response cache key, bumped by bulk changes (loading data, reconciling totals)
+GENERATION_KEY = 'rango:content_generation'
+
+# each cached view also keys on the versions of the content it shows, so a change only drops the pages showing it
+VERSION_KEY = 'rango:content_version:'
+INDEX = 'index'         # the top categories and pages
+SIDEBAR = 'sidebar'     # the category list, with each category's page count
+
+hits = 0
+misses = 0
+
+
+def get_generation():
+    return caches[settings.RANGO_RESPONSE_CACHE].get_or_set(GENERATION_KEY, 1, None)
+
+def bump_generation():
+    '''
+        Makes every cached response stale at once, the old entries just expire.
+    '''
+    try:
+        caches[settings.RANGO_RESPONSE_CACHE].incr(GENERATION_KEY)
+    except ValueError:
+        caches[settings.RANGO_RESPONSE_CACHE].set(GENERATION_KEY, 1, None)
+
+def new_version():
+    # not 1, an evicted version must not start again at a number old entries were stored under
+    return int(time.time() * 1000)
+
+def category_scope(slug):
+    # one category's page: its pages, likes and totals
+    return f'category:{slug}'
+
+def get_versions(scopes):
+    cache = caches[settings.RANGO_RESPONSE_CACHE]
+    keys = [VERSION_KEY + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else cache.get_or_set(key, new_version(), None) for key in keys]
+
+def bump_versions(*scopes):
+    # only processes sharing RANGO_RESPONSE_CACHE see this, the rest catch up when their copies time out
+    cache = caches[settings.RANGO_RESPONSE_CACHE]
+    for scope in scopes:
+        try:
+            cache.incr(VERSION_KEY + scope)
+        except ValueError:
+            cache.set(VERSION_KEY + scope, new_version(), None)
+
+def response_key(request, vary, scopes=()):
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    return f'rango:response:{get_generation()}:{versions}:{path}:{vary}'
+
+def cache_anonymous(vary=None, scopes=()):
+    '''
+        Caches the whole rendered page for anonymous GET requests, and answers
+        If-None-Match / If-Modified-Since with a 304.
+
+        vary(request) is called on every request, cached or not, and what it
+        returns goes into the key - for per-visitor bits like the visit counter.
+
+        scopes lists what the page shows (INDEX, SIDEBAR, category_scope(slug)),
+        or is a function of the view's arguments returning that list. The page
+        is rendered again once bump_versions is called for any of them.
+    '''
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            global hits, misses
+            extra = vary(request) if vary else ''
+
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+
+            cache = caches[settings.RANGO_RESPONSE_CACHE]
+            shown = scopes(request, *args, **kwargs) if callable(scopes) else scopes
+            key = response_key(request, extra, shown)
+            entry = cache.get(key)
+
+            if entry is None:
+                misses = misses + 1
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                    'last_modified': int(time.time()),
+                }
+                cache.set(key, entry, settings.RANGO_RESPONSE_CACHE_TIMEOUT)
+            else:
+                hits = hits + 1
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+
+            response['ETag'] = entry['etag']
+            response['Last-Modified'] = http_date(entry['last_modified'])
+            return get_conditional_response(request, etag=entry['etag'],
+                                            last_modified=entry['last_modified'], response=response)
+        return wrapped
+    return decorator
+
+@registry.register
+def response_cache_metrics():
+    return [
+        ('rango_response_cache_hits_total', 'counter', 'Anonymous pages served from the response cache.',
+         [({}, hits)]),
+        ('rango_response_cache_misses_total', 'counter', 'Anonymous pages rendered and stored in the response cache.',
+         [({}, misses)]),
+    ]
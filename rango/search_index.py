@@ -0,0 +1,157 @@
+import re
+
+from django.db import connection, transaction
+from rango.models import Category, Page
+
+# SQLite FTS5 table holding one row per category and per page
+# kind and object_id point back at the model, the rest is searchable text
+INDEX_TABLE = 'rango_search_index'
+
+# bm25 weights for (kind, object_id, title, url, category), a match in the title counts most
+RANK = f'bm25({INDEX_TABLE}, 0.0, 0.0, 10.0, 2.0, 1.0)'
+
+
+_fts = None
+
+
+def has_fts5(connection):
+    # not every SQLite build comes with FTS5, and other databases don't have it at all
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+def use_fts():
+    # the SQLite library can't change under a running process, so ask it once
+    global _fts
+    if _fts is None:
+        _fts = has_fts5(connection)
+    return _fts
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+def match_expression(query):
+    '''
+        Every word has to match, the last one as a prefix so results show up while typing.
+    '''
+    words = [f'"{word}"' for word in tokenize(query)]
+    if not words:
+        return None
+    words[-1] = words[-1] + '*'
+    return ' '.join(words)
+
+def index_page(page):
+    if not use_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = 'page' AND object_id = %s", [page.id])
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                       f"SELECT 'page', p.id, p.title, p.url, c.name FROM rango_page p "
+                       f"JOIN rango_category c ON c.id = p.category_id WHERE p.id = %s", [page.id])
+
+def index_category(category):
+    if not use_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = 'category' AND object_id = %s", [category.id])
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                       f"VALUES ('category', %s, %s, '', %s)", [category.id, category.name, category.name])
+        # the category name is indexed alongside each of its pages too
+        cursor.execute(f"UPDATE {INDEX_TABLE} SET category = %s WHERE kind = 'page' AND object_id IN "
+                       f"(SELECT id FROM rango_page WHERE category_id = %s)", [category.name, category.id])
+
+def index_categories(category_ids):
+    # these categories and every page in them, for bulk loads (bulk_create doesn't hand back ids on SQLite)
+    if not use_fts():
+        return
+    category_ids = list(category_ids)
+    with connection.cursor() as cursor:
+        for i in range(0, len(category_ids), 500):
+            batch = category_ids[i:i + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = 'category' AND object_id IN ({placeholders})", batch)
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = 'page' AND object_id IN "
+                           f"(SELECT id FROM rango_page WHERE category_id IN ({placeholders}))", batch)
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                           f"SELECT 'category', id, name, '', name FROM rango_category WHERE id IN ({placeholders})", batch)
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                           f"SELECT 'page', p.id, p.title, p.url, c.name FROM rango_page p "
+                           f"JOIN rango_category c ON c.id = p.category_id WHERE p.category_id IN ({placeholders})", batch)
+
+def index_pages(page_ids):
+    # just these pages, e.g. the ones a bulk_create just added
+    if not use_fts():
+        return
+    page_ids = list(page_ids)
+    with connection.cursor() as cursor:
+        for i in range(0, len(page_ids), 500):
+            batch = page_ids[i:i + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = 'page' AND object_id IN ({placeholders})", batch)
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                           f"SELECT 'page', p.id, p.title, p.url, c.name FROM rango_page p "
+                           f"JOIN rango_category c ON c.id = p.category_id WHERE p.id IN ({placeholders})", batch)
+
+def unindex(kind, object_id):
+    if not use_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+
+def rebuild():
+    '''
+        Throws the index away and fills it again from the category and page tables.
+        Returns the number of rows indexed.
+    '''
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                       f"SELECT 'category', id, name, '', name FROM rango_category")
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, url, category) "
+                       f"SELECT 'page', p.id, p.title, p.url, c.name FROM rango_page p "
+                       f"JOIN rango_category c ON c.id = p.category_id")
+        # merge the index b-trees so queries after a big rebuild stay fast
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {INDEX_TABLE}")
+        return cursor.fetchone()[0]
+
+def search(query, limit=20):
+    '''
+        Returns the best matching categories and pages as a list of dicts, best first.
+    '''
+    expression = match_expression(query)
+    if expression is None:
+        return []
+
+    if use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT kind, object_id FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s "
+                           f"ORDER BY {RANK} LIMIT %s", [expression, limit])
+            hits = cursor.fetchall()
+    else:
+        hits = fallback_search(query, limit)
+
+    categories = Category.objects.in_bulk([object_id for kind, object_id in hits if kind == 'category'])
+    pages = Page.objects.select_related('category').in_bulk([object_id for kind, object_id in hits if kind == 'page'])
+
+    results = []
+    for kind, object_id in hits:
+        if kind == 'category' and object_id in categories:
+            results.append({'kind': kind, 'object': categories[object_id]})
+        elif kind == 'page' and object_id in pages:
+            results.append({'kind': kind, 'object': pages[object_id]})
+    return results
+
+def fallback_search(query, limit):
+    # other databases don't have FTS5, so settle for a (slow) icontains scan
+    categories = Category.objects.all()
+    pages = Page.objects.all()
+    for word in tokenize(query):
+        categories = categories.filter(name__icontains=word)
+        pages = pages.filter(title__icontains=word)
+
+    hits = [('category', pk) for pk in categories.values_list('id', flat=True)[:limit]]
+    hits += [('page', pk) for pk in pages.order_by('-views').values_list('id', flat=True)[:limit - len(hits)]]
+    return hits
@@ -0,0 +1,57 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rango.bing_search import normalize_query, run_query, search_cache_key
+from rango.models import Job
+from rango.tasks import latest_job, task
+
+# what each search's outcome looks like to the view
+DONE = 'done'
+PENDING = 'pending'
+FAILED = 'failed'
+
+
+@task(max_attempts=1)
+def search(query):
+    # the client already retries with backoff, and the breaker decides when the API is worth trying again
+    return run_query(query)
+
+def job_key(query):
+    return 'search:' + search_cache_key(query)
+
+def search_later(search_terms, retry_failed=False):
+    '''
+        Results for a search without waiting on the API. Returns (status, results):
+        DONE with the results if they're cached or a worker has fetched them,
+        otherwise the search is queued and it's PENDING until a worker gets to it.
+
+        A search whose job failed stays FAILED unless retry_failed is set.
+    '''
+    query = normalize_query(search_terms)
+    search_cache = caches[settings.RANGO_SEARCH_CACHE]
+
+    results = search_cache.get(search_cache_key(query))
+    if results is not None:
+        return DONE, results
+
+    key = job_key(query)
+    job = latest_job(key)
+
+    if job is not None and job.status in (Job.QUEUED, Job.RUNNING):
+        return PENDING, None
+
+    fresh = job is not None and job.finished is not None and \
+        timezone.now() - job.finished < timedelta(seconds=settings.RANGO_SEARCH_CACHE_TTL)
+    if fresh and job.status == Job.DONE:
+        # the worker may be another process with its own cache, so keep a copy in ours
+        results = json.loads(job.result)
+        search_cache.set(search_cache_key(query), results, settings.RANGO_SEARCH_CACHE_TTL)
+        return DONE, results
+    if fresh and job.status == Job.FAILED and not retry_failed:
+        return FAILED, None
+
+    search.enqueue(query, key=key)
+    return PENDING, None
@@ -0,0 +1,109 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from rango.models import Category, Page, UserProfile
+from rango.caching import invalidate_page_url, invalidate_categories, bump_profiles_version
+from rango.view_counter import page_views_flushed
+from rango.likes import likes_compacted
+from rango import aggregates, leaderboard, search_index
+from rango.response_cache import INDEX, SIDEBAR, bump_versions, category_scope
+from rango.templatetags.rango_template_tags import invalidate_sidebar_categories
+
+
+@receiver([post_save, post_delete], sender=Page)
+def page_changed(sender, instance, **kwargs):
+    # the url may have changed (or the page gone), so drop the cached redirect target
+    invalidate_page_url(instance.id)
+    # and the category's page count and views with it
+    invalidate_categories()
+    invalidate_sidebar_categories()
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, created, **kwargs):
+    # before the totals catch up, while instance.counted still has the category the page was in
+    counted = getattr(instance, 'counted', {})
+    moved = 'category_id' in counted and counted['category_id'] != instance.category_id
+    categories = [instance.category_id, counted['category_id']] if moved else [instance.category_id]
+    # a new or moved page changes the page counts in the sidebar
+    pages_changed(categories, created or moved)
+
+    aggregates.page_saved(instance, created)
+    leaderboard.pages.update({'id': instance.id, 'views': instance.views,
+                              'title': instance.title, 'url': instance.url})
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    pages_changed([instance.category_id], True)
+    aggregates.page_deleted(instance)
+    leaderboard.pages.discard(instance.id)
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_sidebar_categories()
+    invalidate_categories()
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    leaderboard.categories.update({'id': instance.id, 'likes': instance.likes,
+                                   'name': instance.name, 'slug': instance.slug})
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # deleting a category takes its pages with it
+    leaderboard.categories.discard(instance.id)
+    leaderboard.pages.invalidate()
+
+@receiver(page_views_flushed)
+def page_views_written(sender, counts, **kwargs):
+    # the category totals moved too
+    invalidate_categories()
+    categories = Page.objects.filter(id__in=list(counts)).values_list('category_id', flat=True).distinct()
+    pages_changed(list(categories))
+    # bulk updates don't send post_save, so fetch the new totals for the flushed pages
+    for values in Page.objects.filter(id__in=list(counts)).values('id', 'views', 'title', 'url'):
+        leaderboard.pages.update(values)
+
+@receiver(likes_compacted)
+def likes_written(sender, counts, **kwargs):
+    invalidate_categories()
+    pages_changed(list(counts))
+    # likes are added with a bulk update too, so fetch the new totals for the leaderboard
+    for values in Category.objects.filter(id__in=list(counts)).values('id', 'likes', 'name', 'slug'):
+        leaderboard.categories.update(values)
+
+@receiver(post_save, sender=Page)
+def index_page(sender, instance, **kwargs):
+    search_index.index_page(instance)
+
+@receiver(post_delete, sender=Page)
+def unindex_page(sender, instance, **kwargs):
+    search_index.unindex('page', instance.id)
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, **kwargs):
+    search_index.index_category(instance)
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance, **kwargs):
+    search_index.unindex('category', instance.id)
+
+def pages_changed(category_ids, sidebar=False):
+    '''
+        Drops the cached anonymous pages showing these categories' pages,
+        likes or totals: the index, and each category's own page. Pages that
+        show nothing of them, like About, keep their cached copies.
+    '''
+    slugs = Category.objects.filter(id__in=category_ids).values_list('slug', flat=True) if category_ids else []
+    scopes = [INDEX] + [category_scope(slug) for slug in slugs]
+    bump_versions(*(scopes + [SIDEBAR] if sidebar else scopes))
+
+@receiver([post_save, post_delete], sender=Category)
+def category_content_changed(sender, instance, **kwargs):
+    # a category's name is on every page's sidebar
+    bump_versions(INDEX, SIDEBAR, category_scope(instance.slug))
+
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=User)
+def profile_changed(sender, instance, **kwargs):
+    # start a fresh cached profile list
+    bump_profiles_version()
@@ -0,0 +1,277 @@
+import json
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rango.metrics import registry
+from rango.models import Job
+
+logger = logging.getLogger(__name__)
+
+# tries at each queue write before giving up, SQLite only lets one connection write at a time
+LOCK_RETRIES = 6
+
+
+def task(max_attempts=3, retry_delay=5):
+    '''
+        Marks a module level function as something that can run in the
+        background. It can still be called directly as well:
+
+            @task(max_attempts=5)
+            def make_variants(profile_id): ...
+
+            make_variants.enqueue(profile.id, key=f'picture:{profile.id}')
+
+        Arguments and return values have to be JSON serializable. A failed job
+        is retried after retry_delay seconds, doubled for each attempt.
+    '''
+    def decorator(func):
+        name = f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.enqueue = lambda *args, key=None, delay=0: enqueue(name, args, key, delay, max_attempts)
+        return func
+    return decorator
+
+def enqueue(name, args=(), key=None, delay=0, max_attempts=3):
+    '''
+        Adds a job to the queue and returns it. If key is given and a job with
+        that key is still waiting to start, that job is returned instead (moved
+        up to run after delay, if it was going to wait longer). One that has
+        already started doesn't count, it may miss whatever this call is for.
+    '''
+    run_after = timezone.now() + timedelta(seconds=delay)
+
+    if key is not None:
+        job = Job.objects.filter(key=key, status=Job.QUEUED).first()
+        if job is not None:
+            # asking again for it sooner brings it forward
+            Job.objects.filter(id=job.id, status=Job.QUEUED, run_after__gt=run_after).update(run_after=run_after)
+            return job
+
+    job = Job.objects.create(name=name, args=json.dumps(list(args)), key=key, max_attempts=max_attempts,
+                             run_after=run_after)
+    # workers in this process pick it up straight away, once it's committed
+    transaction.on_commit(wake_in_process_worker)
+    return job
+
+def retry_locked(write):
+    '''
+        Calls write(), again after a short wait each time the database is
+        locked by another writer, and returns what it returns.
+    '''
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return write()
+        except OperationalError:
+            if attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+def latest_job(key):
+    return Job.objects.filter(key=key).order_by('-id').first()
+
+def claim(limit):
+    '''
+        Marks up to limit ready jobs as running and returns them. Workers in
+        other processes may be claiming too, so each job is only taken if it's
+        still queued when we get to it.
+    '''
+    now = timezone.now()
+    ready = retry_locked(lambda: list(Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+                                      .order_by('run_after', 'id').values_list('id', flat=True)[:limit]))
+
+    claimed = []
+    for job_id in ready:
+        if retry_locked(lambda: Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, started=now, attempts=F('attempts') + 1)):
+            claimed.append(job_id)
+
+    return retry_locked(lambda: list(Job.objects.filter(id__in=claimed).order_by('run_after', 'id')))
+
+def requeue_stale():
+    # a worker that died mid-job leaves it running, give it back to the queue (it counts as an attempt)
+    cutoff = timezone.now() - timedelta(seconds=settings.RANGO_TASK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, started__lt=cutoff).update(status=Job.QUEUED)
+
+def prune_finished():
+    # finished jobs are only kept around for their results and errors, see RANGO_TASK_KEEP_FINISHED
+    cutoff = timezone.now() - timedelta(seconds=settings.RANGO_TASK_KEEP_FINISHED)
+    return Job.objects.filter(status__in=(Job.DONE, Job.FAILED), finished__lt=cutoff).delete()[0]
+
+def run_job(job):
+    func = None
+    start = time.perf_counter()
+    try:
+        func = import_string(job.name)
+        result = func(*json.loads(job.args))
+    except Exception:
+        error = traceback.format_exc()
+        retry_delay = getattr(func, 'retry_delay', 5)
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay * 2 ** (job.attempts - 1))
+            count('retried')
+        else:
+            job.status = Job.FAILED
+            job.finished = timezone.now()
+            count('failed')
+            logger.error('Job %s (%s) failed after %s attempts\n%s', job.id, job.name, job.attempts, error)
+        job.error = error
+        retry_locked(lambda: job.save(update_fields=['status', 'run_after', 'finished', 'error']))
+    else:
+        job.status = Job.DONE
+        job.finished = timezone.now()
+        job.result = json.dumps(result)
+        retry_locked(lambda: job.save(update_fields=['status', 'finished', 'result']))
+        count('done')
+
+    count('run_seconds', time.perf_counter() - start)
+    count('wait_seconds', (job.started - job.run_after).total_seconds())
+    return job
+
+def run_pending(limit=None):
+    '''
+        Runs every job that's ready, one after another in this thread, and
+        returns how many ran.
+    '''
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim(1)
+        if not jobs:
+            break
+        run_job(jobs[0])
+        ran = ran + 1
+    return ran
+
+
+class Worker(object):
+    '''
+        Claims jobs from the queue and runs up to concurrency of them at a
+        time on a thread pool. Any number of workers, in any number of
+        processes, can share the queue.
+    '''
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or settings.RANGO_TASK_CONCURRENCY
+        self.poll_interval = poll_interval or settings.RANGO_TASK_POLL_INTERVAL
+        self.wakeup = threading.Event()
+        self.stopping = False
+
+    def execute(self, job):
+        try:
+            run_job(job)
+        except Exception:
+            # rather than leave it running until RANGO_TASK_TIMEOUT, run it again
+            logger.exception('Job %s could not be recorded, queueing it again', job.id)
+            close_old_connections()
+            try:
+                retry_locked(lambda: Job.objects.filter(id=job.id, status=Job.RUNNING).update(status=Job.QUEUED))
+            except Exception:
+                logger.exception('Job %s could not be queued again', job.id)
+        finally:
+            # each pool thread has its own connection, don't let them go stale
+            close_old_connections()
+
+    def run(self, once=False):
+        '''
+            Runs jobs until stop() is called, or with once=True until the queue is empty.
+        '''
+        in_flight = set()
+        last_cleanup = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='rango-worker') as pool:
+            while not self.stopping:
+                in_flight = {future for future in in_flight if not future.done()}
+                failed = False
+
+                try:
+                    if time.time() - last_cleanup >= settings.RANGO_TASK_TIMEOUT:
+                        requeue_stale()
+                        prune_finished()
+                        last_cleanup = time.time()
+
+                    jobs = claim(self.concurrency - len(in_flight)) if len(in_flight) < self.concurrency else []
+                except Exception:
+                    # keep going, the database may only be busy for a moment
+                    logger.exception('Could not check the job queue')
+                    close_old_connections()
+                    jobs = []
+                    failed = True
+
+                for job in jobs:
+                    in_flight.add(pool.submit(self.execute, job))
+
+                if not jobs:
+                    if once and not in_flight and not failed:
+                        break
+                    self.wakeup.wait(self.poll_interval)
+                    self.wakeup.clear()
+
+        close_old_connections()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopping = True
+        self.wake()
+
+
+_worker = None
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+def wake_in_process_worker():
+    '''
+        Starts the worker thread for this process on first use (or again if it
+        has died), if RANGO_TASK_IN_PROCESS_WORKERS allows one, and tells it
+        there's work.
+    '''
+    global _worker, _worker_thread
+    if not settings.RANGO_TASK_IN_PROCESS_WORKERS:
+        return
+
+    with _worker_lock:
+        if _worker is None or not _worker_thread.is_alive():
+            _worker = Worker(concurrency=settings.RANGO_TASK_IN_PROCESS_WORKERS)
+            _worker_thread = threading.Thread(target=_worker.run, name='rango-tasks', daemon=True)
+            _worker_thread.start()
+        worker = _worker
+    worker.wake()
+
+
+# totals for /metrics, for the jobs run in this process
+totals = {'done': 0, 'failed': 0, 'retried': 0, 'run_seconds': 0.0, 'wait_seconds': 0.0}
+totals_lock = threading.Lock()
+
+def count(name, n=1):
+    with totals_lock:
+        totals[name] = totals[name] + n
+
+@registry.register
+def task_metrics():
+    now = timezone.now()
+    depth = dict(Job.objects.values_list('status').annotate(n=Count('id')).order_by())
+    oldest = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).aggregate(oldest=Min('run_after'))['oldest']
+
+    return [
+        ('rango_jobs', 'gauge', 'Jobs in the queue table, by status.',
+         [({'status': status}, depth.get(status, 0)) for status, label in Job.STATUSES]),
+        ('rango_job_queue_latency_seconds', 'gauge', 'How long the oldest ready job has been waiting.',
+         [({}, (now - oldest).total_seconds() if oldest else 0)]),
+        ('rango_jobs_run_total', 'counter', 'Jobs run by this process, by outcome.',
+         [({'outcome': outcome}, totals[outcome]) for outcome in ('done', 'failed', 'retried')]),
+        ('rango_job_run_seconds_total', 'counter', 'Time spent running jobs in this process.',
+         [({}, totals['run_seconds'])]),
+        ('rango_job_wait_seconds_total', 'counter', 'Time jobs run by this process waited to start.',
+         [({}, totals['wait_seconds'])]),
+    ]
@@ -0,0 +1,31 @@
+import time
+
+from django.template.backends.django import DjangoTemplates
+from rango.metrics import registry
+
+
+class TimedTemplate(object):
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            registry.add_template_time(time.perf_counter() - start)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    '''
+        The normal Django template engine, but adds the time spent rendering to the current request's metrics.
+    '''
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
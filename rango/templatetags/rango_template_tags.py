@@ -1,8 +1,45 @@
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from rango.models import Category
 
 register = template.Library()
 
+SIDEBAR_CACHE_KEY = 'rango:sidebar_categories'
+
+def get_sidebar_categories():
+    '''
+        Returns ([(name, slug, page count), ...], total number of categories), cached until a category or page
+        changes here, or for RANGO_SIDEBAR_CACHE_TIMEOUT seconds for changes made in other processes.
+    '''
+    sidebar = cache.get(SIDEBAR_CACHE_KEY)
+
+    if sidebar is None:
+        categories = Category.objects.order_by('id').values_list('name', 'slug', 'page_count')
+        limit = settings.RANGO_SIDEBAR_MAX_CATEGORIES
+
+        if limit is None:
+            entries = list(categories)
+            total = len(entries)
+        else:
+            entries = list(categories[:limit])
+            total = len(entries) if len(entries) < limit else Category.objects.count()
+
+        sidebar = (entries, total)
+        cache.set(SIDEBAR_CACHE_KEY, sidebar, settings.RANGO_SIDEBAR_CACHE_TIMEOUT)
+
+    return sidebar
+
+def invalidate_sidebar_categories():
+    cache.delete(SIDEBAR_CACHE_KEY)
+
 @register.inclusion_tag('rango/categories.html')
 def get_category_list(current_category=None):
-    return {'categories': Category.objects.all(), 'current_category': current_category}
\ No newline at end of file
+    entries, total = get_sidebar_categories()
+    current_slug = current_category.slug if current_category else None
+
+    # always show the category we're in, even if it's past the cap
+    if current_category and current_slug not in (entry[1] for entry in entries):
+        entries = entries + [(current_category.name, current_slug, current_category.page_count)]
+
+    return {'categories': entries, 'current_slug': current_slug, 'more': total - len(entries)}
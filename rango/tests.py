@@ -1,3 +1,1327 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image as PILImage
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rango.models import Category, CategoryLike, Job, Page, UserProfile
+from rango.metrics import registry
+from rango.middleware import QueryBudgetExceeded
+from rango.loader import Loader, read_csv
+from django.core.management import call_command
+from rango import view_counter, likes
+from rango.db import ReplicaRouter
+from rango.caching import LRUCache, get_page_url_cache, get_category
+from rango import leaderboard
+from rango.templatetags.rango_template_tags import get_category_list
+from rango import bing_search, config, search_index, benchmark, images, tasks, loader
+from rango.url_normalization import canonicalize, url_hash
+
+
+def add_category(name, views=0, likes=0):
+    c = Category.objects.get_or_create(name=name)[0]
+    c.views = views
+    c.likes = likes
+    c.save()
+    return c
+
+def add_page(category, title, url, views=0):
+    p = Page.objects.get_or_create(category=category, title=title)[0]
+    p.url = url
+    p.views = views
+    p.save()
+    return p
+
+
+class StubSearchAPI(object):
+    '''
+        Local HTTP server standing in for the Bing API, counts the requests it gets.
+    '''
+
+    def __init__(self, delay=0, status=200):
+        self.requests = []
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.requests.append(self.path)
+                time.sleep(delay)
+                body = json.dumps({'webPages': {'value': [
+                    {'name': 'Rango', 'url': 'http://www.tangowithdjango.com/', 'snippet': 'How to Tango with Django'},
+                ]}}).encode('utf-8')
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/search'
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GoToViewTests(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            RANGO_VIEW_SPOOL=os.path.join(self.spool_dir, 'page_views.spool'),
+            RANGO_VIEW_FLUSH_SIZE=1000,
+            RANGO_VIEW_FLUSH_INTERVAL=3600,
+        )
+        self.settings_override.enable()
+
+        category = add_category('Python')
+        self.page = add_page(category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+
+    def test_goto_redirects_before_writing_views(self):
+        response = self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+
+        self.assertRedirects(response, self.page.url, fetch_redirect_response=False)
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 15)
+
+    def test_flush_writes_buffered_views(self):
+        for i in range(3):
+            self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+
+        flushed = []
+        def on_flush(sender, counts, duration, **kwargs):
+            flushed.append(counts)
+        view_counter.page_views_flushed.connect(on_flush)
+
+        try:
+            counts = view_counter.flush_page_views()
+        finally:
+            view_counter.page_views_flushed.disconnect(on_flush)
+
+        self.assertEqual(counts, {self.page.id: 3})
+        self.assertEqual(flushed, [{self.page.id: 3}])
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 18)
+        self.assertEqual(Category.objects.get(id=self.page.category_id).total_views, 18)
+
+    def test_goto_queues_a_flush(self):
+        for i in range(3):
+            self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+
+        # one job for all three clicks, run by a worker
+        self.assertEqual(Job.objects.filter(key='flush_page_views').count(), 1)
+        self.assertEqual(tasks.run_pending(), 0)
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(tasks.run_pending(), 1)
+
+        self.assertEqual(json.loads(Job.objects.get().result), 3)
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 18)
+
+    def test_click_during_flush_queues_another(self):
+        self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+        Job.objects.update(run_after=timezone.now())
+
+        counter = view_counter.get_view_counter()
+        write = counter.write
+        def click_while_writing(counts):
+            # lands in the fresh spool, after this flush moved the old one aside
+            self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+            write(counts)
+
+        with mock.patch.object(counter, 'write', side_effect=click_while_writing):
+            self.assertEqual(tasks.run_pending(), 1)
+
+        # the job left the click for one more
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 16)
+        Job.objects.filter(status=Job.QUEUED).update(run_after=timezone.now())
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 17)
+
+    def test_failed_flush_keeps_its_batch(self):
+        for i in range(3):
+            self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+
+        counter = view_counter.get_view_counter()
+        with mock.patch.object(counter, 'write', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                counter.flush()
+
+        # a click after the failure, then the retry gets everything
+        self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+        self.assertEqual(counter.flush(), {self.page.id: 4})
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 19)
+
+    def test_spooled_views_survive_restart(self):
+        self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+
+        # a fresh counter (as after a restart) still finds the spooled click
+        view_counter.reset_view_counter(setting='RANGO_VIEW_SPOOL')
+        view_counter.flush_page_views()
+
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 16)
+
+    def test_unknown_page_redirects_to_index(self):
+        response = self.client.get(reverse('rango:goto'), {'page_id': 999})
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+
+
+class CategoryTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = add_category('Python')
+        self.django = add_category('Django')
+
+    def totals(self, category):
+        category = Category.objects.get(id=category.id)
+        return category.page_count, category.total_views
+
+    def test_kept_up_to_date_as_pages_change(self):
+        page = add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+        add_page(self.python, 'How to Think like a Computer Scientist', 'http://www.greenteapress.com/thinkpython/', views=5)
+        self.assertEqual(self.totals(self.python), (2, 20))
+
+        page = Page.objects.get(id=page.id)
+        page.views = 25
+        page.save()
+        self.assertEqual(self.totals(self.python), (2, 30))
+
+        page.category = self.django
+        page.save()
+        self.assertEqual(self.totals(self.python), (1, 5))
+        self.assertEqual(self.totals(self.django), (1, 25))
+
+        page.delete()
+        self.assertEqual(self.totals(self.django), (0, 0))
+
+    def test_saving_a_category_keeps_totals(self):
+        stale = Category.objects.get(id=self.python.id)
+        add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+        stale.likes = 10
+        stale.save()
+        self.assertEqual(self.totals(self.python), (1, 15))
+
+    def test_loader_and_reconcile(self):
+        Loader().load([{'category': 'Python', 'title': 'Learn Python in 10 Minutes',
+                        'url': 'http://www.korokithakis.net/tutorials/python/', 'views': '7'}])
+        self.assertEqual(self.totals(self.python), (1, 7))
+
+        Category.objects.filter(id=self.python.id).update(page_count=40, total_views=3)
+        out = io.StringIO()
+        call_command('reconcile_category_totals', stdout=out)
+        self.assertIn('Fixed the totals of 1 categories', out.getvalue())
+        self.assertEqual(self.totals(self.python), (1, 7))
+
+    def test_sidebar_shows_page_count(self):
+        self.assertEqual(get_category_list()['categories'][0], ('Python', 'python', 0))
+        add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial')
+        self.assertEqual(get_category_list()['categories'][0], ('Python', 'python', 1))
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b', None))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_expires_after_ttl(self):
+        cache = LRUCache(ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a', None))
+
+
+@override_settings(RANGO_REDIRECT_CACHE=None)
+class PageURLCacheTests(TestCase):
+    def setUp(self):
+        self.page = add_page(add_category('Python'), 'Official Python Tutorial', 'http://docs.python.org/3/tutorial')
+
+    def test_second_lookup_skips_database(self):
+        cache = get_page_url_cache()
+        self.assertEqual(cache.get(self.page.id), self.page.url)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(self.page.id), self.page.url)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_page_save_invalidates(self):
+        cache = get_page_url_cache()
+        cache.get(self.page.id)
+
+        self.page.url = 'http://www.python.org/'
+        self.page.save()
+        self.assertEqual(cache.get(self.page.id), 'http://www.python.org/')
+
+        page_id = self.page.id
+        self.page.delete()
+        self.assertIsNone(cache.get(page_id))
+
+
+class CategoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = add_category('Python', likes=64)
+        add_page(self.category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+
+    def category_queries(self, url, method='get', data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        return [q for q in queries.captured_queries if '"rango_category"."slug" =' in q['sql']]
+
+    def test_views_share_the_lookup(self):
+        self.assertEqual(get_category('python'), self.category)
+        self.assertIsNone(get_category('perl'))
+
+        self.assertEqual(self.category_queries(reverse('rango:show_category', kwargs={'category_name_slug': 'python'})), [])
+        self.assertEqual(self.category_queries(reverse('rango:add_page', kwargs={'category_name_slug': 'python'})), [])
+        self.assertEqual(self.category_queries(reverse('rango:category_pages_json', kwargs={'category_name_slug': 'python'})), [])
+
+    def test_unknown_slugs_are_not_cached(self):
+        self.assertIsNone(get_category('perl'))
+        # as if added by another process, which can't clear this one's cache
+        Category.objects.bulk_create([Category(name='Perl', slug='perl')])
+        self.assertEqual(get_category('perl').name, 'Perl')
+
+    def test_saving_invalidates(self):
+        get_category('python')
+        self.category.name = 'Python 3'
+        self.category.save()
+
+        self.assertIsNone(get_category('python'))
+        self.assertEqual(get_category('python-3').name, 'Python 3')
+
+    def test_copies_are_per_request(self):
+        get_category('python').likes = 1000
+        self.assertEqual(get_category('python').likes, 64)
+
+
+@override_settings(RANGO_LEADERBOARD_SIZE=2)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = add_category('Python', likes=64)
+        self.django = add_category('Django', likes=32)
+        self.other = add_category('Other Frameworks', likes=16)
+
+    def names(self):
+        return [c['name'] for c in leaderboard.top_categories()]
+
+    def test_reads_from_cache(self):
+        self.assertEqual(self.names(), ['Python', 'Django'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Python', 'Django'])
+
+    def test_incremental_update(self):
+        self.names()
+        self.other.likes = 100
+        self.other.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Other Frameworks', 'Python'])
+
+    def test_ties_go_to_the_oldest(self):
+        Category.objects.filter(id=self.other.id).update(likes=64)
+        self.assertEqual(self.names(), ['Python', 'Other Frameworks'])
+
+    def test_decrease_rebuilds(self):
+        self.names()
+        self.python.likes = 0
+        self.python.save()
+        self.assertEqual(self.names(), ['Django', 'Other Frameworks'])
+
+    def test_flushed_views_update_pages(self):
+        page = add_page(self.python, 'Flask', 'http://flask.pocoo.org', views=1)
+        add_page(self.python, 'Bottle', 'http://bottlepy.org/docs/dev/', views=5)
+        add_page(self.python, 'Django Rocks', 'http://www.djangorocks.com/', views=3)
+        self.assertEqual([p['title'] for p in leaderboard.top_pages()], ['Bottle', 'Django Rocks'])
+
+        Page.objects.filter(id=page.id).update(views=10)
+        view_counter.page_views_flushed.send(sender=None, counts={page.id: 9}, duration=0)
+
+        self.assertEqual([p['title'] for p in leaderboard.top_pages()], ['Flask', 'Bottle'])
+
+
+@override_settings(RANGO_CATEGORY_PAGE_SIZE=2, RANGO_CATEGORY_STREAM_BATCH_SIZE=2)
+class CategoryPaginationTests(TestCase):
+    def setUp(self):
+        self.category = add_category('Other Frameworks')
+        for title, views in [('Bottle', 19), ('Flask', 11), ('Pyramid', 11), ('Tornado', 3), ('Sanic', 0)]:
+            add_page(self.category, title, f'http://www.{title.lower()}.org/', views)
+        self.url = reverse('rango:show_category', kwargs={'category_name_slug': self.category.slug})
+
+    def test_follows_cursor_through_every_page(self):
+        titles = []
+        cursor = None
+        while True:
+            response = self.client.get(self.url, {'cursor': cursor} if cursor else {})
+            titles.extend(p.title for p in response.context['pages'])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(titles, ['Bottle', 'Flask', 'Pyramid', 'Tornado', 'Sanic'])
+
+    def test_bad_cursor_starts_from_the_top(self):
+        response = self.client.get(self.url, {'cursor': 'nonsense'})
+        self.assertEqual([p.title for p in response.context['pages']], ['Bottle', 'Flask'])
+
+    def test_json_stream(self):
+        response = self.client.get(reverse('rango:category_pages_json', kwargs={'category_name_slug': self.category.slug}))
+        self.assertTrue(response.streaming)
+
+        pages = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([p['title'] for p in pages], ['Bottle', 'Flask', 'Pyramid', 'Tornado', 'Sanic'])
+
+
+@override_settings(RANGO_SIDEBAR_MAX_CATEGORIES=2)
+class CategorySidebarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = add_category('Python')
+        self.django = add_category('Django')
+        self.other = add_category('Other Frameworks')
+
+    def test_cached_until_category_changes(self):
+        get_category_list()
+        with self.assertNumQueries(0):
+            context = get_category_list(self.python)
+        self.assertEqual(context['categories'], [('Python', 'python', 0), ('Django', 'django', 0)])
+        self.assertEqual(context['current_slug'], 'python')
+
+        self.python.name = 'Python 3'
+        self.python.save()
+        self.assertEqual(get_category_list()['categories'][0], ('Python 3', 'python-3', 0))
+
+    def test_changes_elsewhere_show_up_after_timeout(self):
+        with override_settings(RANGO_SIDEBAR_CACHE_TIMEOUT=0):
+            get_category_list()
+            # a rename in another process, which can't clear this process's cache
+            Category.objects.filter(id=self.python.id).update(name='Python 3')
+            self.assertEqual(get_category_list()['categories'][0][0], 'Python 3')
+
+    def test_cap_keeps_current_category(self):
+        context = get_category_list(self.other)
+        self.assertEqual(context['categories'][-1], ('Other Frameworks', 'other-frameworks', 0))
+        self.assertEqual(context['more'], 0)
+        self.assertEqual(get_category_list()['more'], 1)
+
+
+@override_settings(RANGO_SEARCH_KEY='test-key')
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['search'].clear()
+
+    def test_normalized_queries_share_cache(self):
+        with StubSearchAPI() as api, override_settings(RANGO_SEARCH_URL=api.url):
+            results = bing_search.run_query('Tango with Django')
+            self.assertEqual(bing_search.run_query('  tango   WITH django '), results)
+
+        self.assertEqual(results[0]['title'], 'Rango')
+        self.assertEqual(len(api.requests), 1)
+
+    def test_concurrent_queries_are_coalesced(self):
+        with StubSearchAPI(delay=0.2) as api, override_settings(RANGO_SEARCH_URL=api.url):
+            threads = [threading.Thread(target=bing_search.run_query, args=('rango',)) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(api.requests), 1)
+
+
+@override_settings(RANGO_SEARCH_KEY='test-key')
+@override_settings(RANGO_SEARCH_RETRIES=0, RANGO_SEARCH_BREAKER_THRESHOLD=2)
+class SearchClientTests(TestCase):
+    def setUp(self):
+        caches['search'].clear()
+        self.category = add_category('Python')
+        self.user = User.objects.create_user('rango', password='tango-with-django')
+        self.client.force_login(self.user)
+        self.url = reverse('rango:show_category', kwargs={'category_name_slug': self.category.slug})
+
+    def search(self, query):
+        # the searches are queued, so the page comes back before they're done
+        response = self.client.post(self.url, {'query': query})
+        self.assertTrue(response.context['search_pending'])
+        tasks.run_pending()
+        return self.client.get(self.url, {'query': query})
+
+    def test_results_are_rendered(self):
+        with StubSearchAPI() as api, override_settings(RANGO_SEARCH_URL=api.url):
+            response = self.search('django')
+
+        self.assertNotIn('search_pending', response.context)
+        self.assertEqual(response.context['result_list'][0]['title'], 'Rango')
+        self.assertEqual(response.context['category_result_list'][0]['title'], 'Rango')
+        self.assertEqual(sorted(path.split('q=')[1].split('&')[0] for path in api.requests), ['django', 'django+python'])
+
+    def test_breaker_opens_after_failures(self):
+        with StubSearchAPI(status=500) as api, override_settings(RANGO_SEARCH_URL=api.url), \
+                self.assertLogs('rango.tasks', 'ERROR'):
+            for query in ('one', 'two', 'three'):
+                response = self.search(query)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('search_error', response.context)
+
+            self.assertTrue(bing_search.get_search_client().breaker.is_open)
+
+        # once the first page's two searches failed, nothing else reached the API
+        self.assertEqual(len(api.requests), 2)
+
+
+class SearchKeyTests(TestCase):
+    def setUp(self):
+        self.key_dir = tempfile.mkdtemp()
+        self.key_file = os.path.join(self.key_dir, 'bing.key')
+
+    def test_reload_signal_is_opt_in(self):
+        with mock.patch('rango.config.signal.signal') as install:
+            config.setup_search_key()
+            install.assert_not_called()
+
+            with override_settings(RANGO_SEARCH_KEY_RELOAD_SIGNAL='SIGHUP'):
+                config.setup_search_key()
+            install.assert_called_once_with(signal.SIGHUP, config.reload_search_key)
+
+    def tearDown(self):
+        shutil.rmtree(self.key_dir)
+        config.reload_search_key()
+
+    def test_key_read_once_from_file(self):
+        with open(self.key_file, 'w') as f:
+            f.write('file-key\n')
+
+        with override_settings(RANGO_SEARCH_KEY=None, RANGO_SEARCH_KEY_FILE=self.key_file):
+            self.assertEqual(config.get_search_key(), 'file-key')
+            os.remove(self.key_file)
+            self.assertEqual(config.get_search_key(), 'file-key')
+
+    def test_missing_key_fails_fast(self):
+        with override_settings(RANGO_SEARCH_KEY=None, RANGO_SEARCH_KEY_FILE=self.key_file,
+                               RANGO_SEARCH_KEY_REQUIRED=True), mock.patch.dict(os.environ, {config.SEARCH_KEY_ENV: ''}):
+            with self.assertRaises(ImproperlyConfigured):
+                config.setup_search_key()
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.python = add_category('Python')
+        self.django = add_category('Django')
+        self.tutorial = add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial')
+        add_page(self.django, 'Official Django Tutorial', 'https://docs.djangoproject.com/en/2.1/intro/tutorial01/')
+        add_page(self.django, 'Django Rocks', 'http://www.djangorocks.com/')
+
+    def titles(self, query):
+        return [str(result['object']) for result in search_index.search(query)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles('django')[:2], ['Django', 'Django Rocks'])
+        self.assertEqual(self.titles('tutorial pyth'), ['Official Python Tutorial'])
+
+    def test_kept_up_to_date_from_saves_and_deletes(self):
+        self.tutorial.title = 'The Python Tutorial'
+        self.tutorial.save()
+        self.assertEqual(self.titles('official python'), [])
+
+        self.python.name = 'Snakes'
+        self.python.save()
+        # pages are indexed with the name of their category
+        self.assertEqual(self.titles('snakes'), ['Snakes', 'The Python Tutorial'])
+
+        self.django.delete()
+        self.assertEqual(self.titles('django'), [])
+
+    def test_rebuild(self):
+        self.assertEqual(search_index.rebuild(), 5)
+        self.assertEqual(self.titles('rocks'), ['Django Rocks'])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('rango:search'), {'query': 'rocks'})
+        self.assertContains(response, 'Django Rocks')
+
+    def test_sqlite_without_fts5_falls_back(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            options = cursor.fetchall()
+        self.assertEqual(search_index.has_fts5(connection), ('ENABLE_FTS5',) in options)
+
+        with mock.patch('rango.search_index._fts', False):
+            self.assertEqual(self.titles('rocks'), ['Django Rocks'])
+            self.tutorial.delete()
+            self.assertEqual(self.titles('official python'), [])
+
+
+@override_settings(RANGO_PROFILES_PAGE_SIZE=3)
+class ListProfileViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rango', password='tango-with-django')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def add_profiles(self, n):
+        for i in range(n):
+            UserProfile.objects.create(user=User.objects.create_user(f'user{UserProfile.objects.count()}'))
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('rango:list_profiles'))
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_profiles(self):
+        self.add_profiles(1)
+        few = self.count_queries()
+        self.add_profiles(10)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_fragment_cached_until_profiles_change(self):
+        self.add_profiles(1)
+        self.client.get(reverse('rango:list_profiles'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('rango:list_profiles'))
+        self.assertFalse(any('rango_userprofile' in q['sql'] for q in queries))
+        self.assertNotContains(response, 'newcomer')
+
+        UserProfile.objects.create(user=User.objects.create_user('newcomer'))
+        self.assertContains(self.client.get(reverse('rango:list_profiles')), 'newcomer')
+
+    def test_cursor_pagination(self):
+        self.add_profiles(4)
+        response = self.client.get(reverse('rango:list_profiles'))
+        self.assertEqual(len(response.context['profile_page'].items), 3)
+
+        cursor = response.context['profile_page'].next_cursor
+        response = self.client.get(reverse('rango:list_profiles'), {'cursor': cursor})
+        self.assertEqual(len(response.context['profile_page'].items), 2)
+        self.assertIsNone(response.context['profile_page'].next_cursor)
+
+
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.user = User.objects.create_user('rango', password='tango-with-django')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, colour='red'):
+        out = io.BytesIO()
+        PILImage.new('RGB', (800, 600), colour).save(out, 'PNG')
+        return SimpleUploadedFile('me.png', out.getvalue(), content_type='image/png')
+
+    def test_upload_schedules_variants(self):
+        with mock.patch('rango.views.generate_variants_later') as later:
+            self.client.post(reverse('rango:profile', kwargs={'username': 'rango'}),
+                             {'website': '', 'picture': self.upload()})
+        self.assertEqual(later.call_count, 1)
+
+        # a new picture drops the old variants until the new ones are ready
+        UserProfile.objects.filter(id=self.profile.id).update(picture_thumbnail='old.webp')
+        with mock.patch('rango.views.generate_variants_later'):
+            self.client.post(reverse('rango:profile', kwargs={'username': 'rango'}),
+                             {'website': '', 'picture': self.upload('blue')})
+        self.assertEqual(UserProfile.objects.get(id=self.profile.id).picture_thumbnail, '')
+
+    def test_make_variants(self):
+        self.profile.picture = self.upload()
+        self.profile.save()
+
+        names = images.make_variants(self.profile.id)
+        profile = UserProfile.objects.get(id=self.profile.id)
+        self.assertEqual(profile.picture_thumbnail.name, names['thumbnail'])
+        self.assertEqual(profile.picture_medium.name, names['medium'])
+
+        with PILImage.open(os.path.join(self.media, names['thumbnail'])) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (60, 60)))
+
+        # same picture, same names
+        self.assertEqual(images.make_variants(self.profile.id), names)
+        self.assertContains(self.client.get(reverse('rango:list_profiles')), names['thumbnail'])
+
+    def test_variants_cached_forever(self):
+        self.profile.picture = self.upload()
+        self.profile.save()
+        name = images.make_variants(self.profile.id)['thumbnail']
+
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+@override_settings(RANGO_QUERY_BUDGET_STRICT=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.category = add_category('Python', likes=64)
+        add_page(self.category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+
+    def test_views_stay_within_budget(self):
+        self.client.get(reverse('rango:index'))
+        self.client.get(reverse('rango:about'))
+        self.client.get(reverse('rango:show_category', kwargs={'category_name_slug': 'python'}))
+        self.client.get(reverse('rango:search'), {'query': 'python'})
+
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+        self.client.get(reverse('rango:index'))
+        self.client.get(reverse('rango:list_profiles'))
+
+    def test_budget_exceeded(self):
+        with override_settings(RANGO_QUERY_BUDGETS={'rango:index': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('rango:index'))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('rango:index'))
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('rango_requests_total{view="rango:index"} 1', text)
+        self.assertIn('rango_request_duration_seconds_count{view="rango:index"} 1', text)
+        self.assertIn('rango_template_seconds_total{view="rango:index"}', text)
+        self.assertIn('rango_redirect_cache_hits_total', text)
+
+    def test_metrics_endpoint_is_local_only(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = add_category('Python', likes=64)
+        add_page(self.category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+        self.url = reverse('rango:show_category', kwargs={'category_name_slug': 'python'})
+
+    def test_anonymous_pages_are_cached(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertFalse([q for q in queries.captured_queries if 'rango_' in q['sql']])
+
+    def test_not_modified(self):
+        first = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_page_write_invalidates(self):
+        self.client.get(self.url)
+        add_page(self.category, 'Python for Everybody', 'http://www.py4e.com/')
+
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Python for Everybody')
+
+    def test_flushed_views_invalidate(self):
+        page = Page.objects.get()
+        first = self.client.get(self.url)
+        view_counter.page_views_flushed.send(sender=None, counts={page.id: 1}, duration=0)
+        self.assertIsNotNone(self.client.get(self.url).context)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_invalidation_is_per_category(self):
+        django = add_category('Django')
+        django_url = reverse('rango:show_category', kwargs={'category_name_slug': 'django'})
+        about_url = reverse('rango:about')
+        for url in (self.url, django_url, about_url, reverse('rango:index')):
+            self.client.get(url)
+
+        # new views on a python page: the python page and the index, but not django's page or about
+        page = Page.objects.get()
+        view_counter.page_views_flushed.send(sender=None, counts={page.id: 1}, duration=0)
+        self.assertIsNotNone(self.client.get(self.url).context)
+        self.assertIsNotNone(self.client.get(reverse('rango:index')).context)
+        self.assertIsNone(self.client.get(django_url).context)
+        self.assertIsNone(self.client.get(about_url).context)
+
+        # a new page changes the page counts in everyone's sidebar
+        add_page(django, 'Django Girls', 'https://tutorial.djangogirls.org/')
+        self.assertIsNotNone(self.client.get(about_url).context)
+
+    def test_logged_in_users_are_not_cached(self):
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+        self.client.get(self.url)
+        self.assertIsNotNone(self.client.get(self.url).context)
+
+    def test_about_still_counts_visits(self):
+        self.assertContains(self.client.get(reverse('rango:about')), 'Visits: 1')
+        with mock.patch('rango.views.time.time', return_value=time.time() + 25 * 60 * 60):
+            self.assertContains(self.client.get(reverse('rango:about')), 'Visits: 2')
+        self.assertContains(self.client.get(reverse('rango:about')), 'Visits: 2')
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = add_category('Python', likes=64)
+        self.other = add_category('Django', likes=32)
+        self.user = User.objects.create_user('rango', password='tango-with-django')
+        self.client.force_login(self.user)
+        self.url = reverse('rango:like_category', kwargs={'category_name_slug': 'python'})
+
+    def test_one_like_per_user(self):
+        response = self.client.post(self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'liked': True, 'likes': 65})
+        response = self.client.post(self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'liked': False, 'likes': 65})
+
+    def test_compaction_adds_pending_likes(self):
+        # the likes wait for a job that runs after the interval
+        for i in range(3):
+            likes.like_category(User.objects.create_user(f'user{i}'), self.category)
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 64)
+        self.assertEqual(likes.pending_likes(self.category), 3)
+        self.assertEqual(Job.objects.filter(key='compact_likes').count(), 1)
+        self.assertEqual(tasks.run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 67)
+        self.assertEqual(likes.compact_likes(), {})
+
+    def test_overlapping_compaction_writes_nothing(self):
+        for i in range(3):
+            likes.like_category(User.objects.create_user(f'user{i}'), self.category)
+
+        # another compaction marks one of them between this one reading and writing
+        first = CategoryLike.objects.order_by('id').first()
+        def count_then_overlap(category_ids):
+            CategoryLike.objects.filter(id=first.id).update(compacted=True)
+            return Counter(category_ids)
+
+        with mock.patch('rango.likes.Counter', side_effect=count_then_overlap):
+            with self.assertRaises(likes.CompactionConflict):
+                likes.compact_likes()
+
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 64)
+        self.assertEqual(likes.pending_likes(self.category), 2)
+
+    def test_leaderboard_follows_likes(self):
+        self.assertEqual([c['name'] for c in leaderboard.top_categories()], ['Python', 'Django'])
+        for i in range(40):
+            likes.like_category(User.objects.create_user(f'user{i}'), self.other)
+        call_command('compact_likes', stdout=io.StringIO())
+
+        self.assertEqual([c['name'] for c in leaderboard.top_categories()], ['Django', 'Python'])
+        self.assertEqual(leaderboard.top_categories()[0]['score'], 72)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.client.post(self.url)
+        self.assertEqual(likes.pending_likes(self.category), 0)
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 64)
+
+
+# the test database stands in for the replica, the tests check which reads the router sends to it
+@override_settings(RANGO_DB_REPLICAS=['default'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = add_category('Python', likes=64)
+        add_page(self.category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial', views=15)
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+
+    def routed_reads(self, method, url, data=None):
+        # model -> where the router sent its reads (None means the primary)
+        routed = {}
+        db_for_read = ReplicaRouter.db_for_read
+        def spy(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            routed.setdefault(model._meta.label, set()).add(alias)
+            return alias
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', spy):
+            getattr(self.client, method)(url, data)
+        return routed
+
+    def test_read_only_views_read_from_replica(self):
+        routed = self.routed_reads('get', reverse('rango:show_category', kwargs={'category_name_slug': 'python'}))
+        self.assertEqual(routed['rango.Page'], {'default'})
+        # sessions and users stay on the primary
+        self.assertEqual(routed['sessions.Session'], {None})
+        self.assertEqual(routed['auth.User'], {None})
+
+    def test_writes_go_to_primary(self):
+        routed = self.routed_reads('post', reverse('rango:add_page', kwargs={'category_name_slug': 'python'}),
+                                   {'title': 'Python for Everybody', 'url': 'http://www.py4e.com/', 'views': 0})
+        self.assertTrue(Page.objects.filter(url='http://www.py4e.com/').exists())
+        self.assertEqual({alias for aliases in routed.values() for alias in aliases}, {None})
+
+    def test_replicas_are_not_migrated(self):
+        with override_settings(RANGO_DB_REPLICAS=['replica1']):
+            self.assertFalse(ReplicaRouter().allow_migrate('replica1', 'rango'))
+            self.assertTrue(ReplicaRouter().allow_migrate('default', 'rango'))
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+class AddPagesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = add_category('Python')
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+        self.url = reverse('rango:add_pages', kwargs={'category_name_slug': 'python'})
+
+    def test_json_batch(self):
+        pages = [{'title': 'Official Python Tutorial', 'url': 'docs.python.org/3/tutorial', 'views': -50},
+                 {'title': '', 'url': 'http://www.py4e.com/'},
+                 {'title': 'Learn Python in 10 Minutes', 'url': 'http://www.korokithakis.net/tutorials/python/', 'views': 4}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, json.dumps(pages), content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([e['row'] for e in response.json()['errors']], [1])
+        self.assertIn('title', response.json()['errors'][0]['errors'])
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "rango_page"')]), 1)
+
+        # same rules as the form, the scheme is added when it's missing
+        self.assertTrue(Page.objects.filter(url='http://docs.python.org/3/tutorial').exists())
+        category = Category.objects.get(id=self.category.id)
+        # views aren't taken from the request
+        self.assertEqual((category.page_count, category.total_views), (2, 0))
+        self.assertEqual(set(Page.objects.values_list('views', flat=True)), {0})
+        self.assertEqual(len(search_index.search('korokithakis')), 1)
+
+    def test_only_new_pages_are_indexed(self):
+        add_page(self.category, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial/', views=10)
+        pages = [{'title': 'Learn Python in 10 Minutes', 'url': 'http://www.korokithakis.net/tutorials/python/'}]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, json.dumps(pages), content_type='application/json')
+
+        new_page = Page.objects.get(title='Learn Python in 10 Minutes')
+        indexed = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'INSERT INTO {search_index.INDEX_TABLE}')]
+        if search_index.use_fts():
+            self.assertEqual(len(indexed), 1)
+            self.assertTrue(indexed[0].endswith(f'WHERE p.id IN ({new_page.id})'))
+        category = Category.objects.get(id=self.category.id)
+        self.assertEqual((category.page_count, category.total_views), (2, 10))
+        self.assertEqual(len(search_index.search('korokithakis')), 1)
+
+    def test_csv_batch(self):
+        body = 'title,url,views\n' + ''.join(f'Page {i},http://www.example.com/{i}/,{i}\n' for i in range(2000))
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.json(), {'created': 2000, 'errors': []})
+        self.assertEqual(Page.objects.filter(category=self.category).count(), 2000)
+
+    def test_bad_requests(self):
+        response = self.client.post(self.url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, 'name\nPython\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('rango:add_pages', kwargs={'category_name_slug': 'perl'}),
+                                    '[]', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        with override_settings(RANGO_BULK_PAGES_MAX_ROWS=1):
+            response = self.client.post(self.url, '[{}, {}]', content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+
+class URLDedupeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = add_category('Python')
+        self.django = add_category('Django')
+        self.page = add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/3/tutorial/', views=15)
+        self.client.force_login(User.objects.create_user('rango', password='tango-with-django'))
+
+    def test_canonicalize(self):
+        self.assertEqual(canonicalize('Docs.Python.ORG/3/tutorial/'), 'http://docs.python.org/3/tutorial')
+        self.assertEqual(canonicalize('https://docs.python.org:443/3/tutorial#intro'), 'https://docs.python.org/3/tutorial')
+        self.assertEqual(canonicalize('http://example.com/?utm_source=rango&b=2&a=1&fbclid=x'), 'http://example.com/?a=1&b=2')
+        self.assertEqual(canonicalize('http://example.com:8000'), 'http://example.com:8000/')
+        self.assertEqual(self.page.url_hash, url_hash('HTTP://docs.python.org/3/tutorial?utm_medium=email'))
+
+    def test_add_page_rejects_duplicates(self):
+        url = reverse('rango:add_page', kwargs={'category_name_slug': 'django'})
+        response = self.client.post(url, {'title': 'Tutorial', 'url': 'docs.python.org/3/tutorial?utm_source=x', 'views': 0})
+        self.assertContains(response, 'already been added')
+
+        response = self.client.post(url, {'title': 'Django Docs', 'url': 'HTTPS://DocS.djangoproject.com/', 'views': 0})
+        self.assertEqual(response.status_code, 302)
+        # stored as submitted, only compared by its canonical form
+        page = Page.objects.get(title='Django Docs')
+        self.assertEqual(page.url, 'https://DocS.djangoproject.com/')
+        self.assertEqual(page.url_hash, url_hash('https://docs.djangoproject.com'))
+
+        response = self.client.post(url, {'title': 'Intro', 'url': 'http://www.djangobook.com/en/2.0/?b=2&a=1#intro', 'views': 0})
+        self.assertEqual(Page.objects.get(title='Intro').url, 'http://www.djangobook.com/en/2.0/?b=2&a=1#intro')
+
+    def test_bulk_paths_skip_duplicates(self):
+        pages = [{'title': 'Tutorial', 'url': 'http://docs.python.org/3/tutorial'},
+                 {'title': 'Python for Everybody', 'url': 'http://www.py4e.com/'},
+                 {'title': 'Python for Everybody again', 'url': 'http://www.py4e.com'}]
+        response = self.client.post(reverse('rango:add_pages', kwargs={'category_name_slug': 'python'}),
+                                    json.dumps(pages), content_type='application/json')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([e['row'] for e in response.json()['errors']], [0, 2])
+        self.assertTrue(Page.objects.get(title='Python for Everybody').url_hash)
+
+        stats = Loader().load([{'category': 'Django', 'title': 'Tutorial', 'url': 'docs.python.org/3/tutorial'},
+                               {'category': 'Django', 'title': 'Django Girls', 'url': 'https://tutorial.djangogirls.org/'}])
+        self.assertEqual((stats['pages_created'], stats['duplicates']), (1, 1))
+        self.assertEqual(Page.objects.get(title='Django Girls').url_hash, url_hash('https://tutorial.djangogirls.org'))
+
+    def test_admin_rejects_duplicates(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'tango-with-django'))
+        response = self.client.post(reverse('admin:rango_page_add'), {
+            'category': self.django.id, 'title': 'Tutorial', 'url': 'http://DOCS.python.org/3/tutorial', 'views': 0})
+
+        self.assertContains(response, 'already been added')
+        self.assertEqual(Page.objects.count(), 1)
+
+    def test_unmerged_duplicates_can_still_be_saved(self):
+        # from before the unique index, dedupe_pages hasn't merged it yet
+        Page.objects.bulk_create([Page(category=self.django, title='Tutorial', url='http://docs.python.org/3/tutorial')])
+        old = Page.objects.get(title='Tutorial')
+        old.title = 'Tutorial (old)'
+        old.full_clean()
+        old.save()
+
+        self.assertIsNone(Page.objects.get(id=old.id).url_hash)
+
+    def test_concurrent_adds_dont_fail(self):
+        # as if another request added the url between the check and the insert
+        with mock.patch('rango.forms.PageForm.is_duplicate', return_value=False):
+            response = self.client.post(reverse('rango:add_page', kwargs={'category_name_slug': 'django'}),
+                                        {'title': 'Tutorial', 'url': 'http://docs.python.org/3/tutorial', 'views': 0})
+        self.assertContains(response, 'already been added')
+
+        pages = [{'title': 'Tutorial', 'url': 'http://docs.python.org/3/tutorial'},
+                 {'title': 'Python for Everybody', 'url': 'http://www.py4e.com/'}]
+        # nothing taken at the first look, then the insert finds the tutorial already there
+        looks = [{}, {self.page.url_hash: self.page.id}]
+        taken_hashes = loader.taken_hashes
+        with mock.patch('rango.loader.taken_hashes', side_effect=lambda hashes: looks.pop(0) if looks else taken_hashes(hashes)):
+            response = self.client.post(reverse('rango:add_pages', kwargs={'category_name_slug': 'django'}),
+                                        json.dumps(pages), content_type='application/json')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([e['row'] for e in response.json()['errors']], [0])
+
+    def test_dedupe_merges_views(self):
+        # duplicates from before the unique index, they were never hashed
+        Page.objects.bulk_create([
+            Page(category=self.django, title='Tutorial', url='http://docs.python.org/3/tutorial', views=5),
+            Page(category=self.python, title='Tutorial again', url='http://DOCS.python.org/3/tutorial/#top', views=1),
+        ])
+        call_command('reconcile_category_totals', stdout=io.StringIO())
+
+        out = io.StringIO()
+        call_command('dedupe_pages', stdout=out)
+        self.assertIn('Merged 2 duplicate pages', out.getvalue())
+
+        self.assertEqual(list(Page.objects.values_list('id', 'views')), [(self.page.id, 21)])
+        self.assertEqual(Category.objects.get(id=self.python.id).total_views, 21)
+        self.assertEqual(Category.objects.get(id=self.python.id).page_count, 1)
+        self.assertEqual(Category.objects.get(id=self.django.id).page_count, 0)
+
+
+attempts_seen = []
+
+@tasks.task(max_attempts=3, retry_delay=0)
+def flaky_job(failures):
+    attempts_seen.append(failures)
+    if len(attempts_seen) <= failures:
+        raise ValueError('not yet')
+    return len(attempts_seen)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        del attempts_seen[:]
+
+    def test_enqueue_dedupes_by_key(self):
+        first = flaky_job.enqueue(0, key='flaky', delay=60)
+        second = flaky_job.enqueue(0, key='flaky')
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.objects.count(), 1)
+        # asking for it sooner brought it forward
+        self.assertEqual(tasks.run_pending(), 1)
+
+        # once it's finished the key can be queued again
+        self.assertNotEqual(flaky_job.enqueue(0, key='flaky').id, first.id)
+
+    def test_running_job_is_not_reused(self):
+        # it may already be past whatever the second caller needs done
+        first = flaky_job.enqueue(0, key='flaky')
+        tasks.claim(1)
+
+        self.assertNotEqual(flaky_job.enqueue(0, key='flaky').id, first.id)
+
+    def test_old_finished_jobs_are_pruned(self):
+        flaky_job.enqueue(0)
+        flaky_job.enqueue(0)
+        tasks.run_pending()
+        Job.objects.filter(id=Job.objects.first().id).update(finished=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(tasks.prune_finished(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_retries_then_succeeds(self):
+        job = flaky_job.enqueue(2)
+        self.assertEqual(tasks.run_pending(), 3)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(json.loads(job.result), 3)
+
+    def test_gives_up_after_max_attempts(self):
+        job = flaky_job.enqueue(5)
+        with self.assertLogs('rango.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 3)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('ValueError: not yet', job.error)
+
+    def test_delayed_jobs_wait(self):
+        flaky_job.enqueue(0, delay=60)
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_stale_jobs_are_requeued(self):
+        job = flaky_job.enqueue(0)
+        Job.objects.update(status=Job.RUNNING, started=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(tasks.requeue_stale(), 1)
+        self.assertEqual(tasks.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_metrics(self):
+        flaky_job.enqueue(0)
+        flaky_job.enqueue(0, delay=60)
+        tasks.run_pending()
+
+        text = registry.render()
+        self.assertIn('rango_jobs{status="queued"} 1', text)
+        self.assertIn('rango_jobs{status="done"} 1', text)
+        self.assertIn('rango_job_queue_latency_seconds', text)
+        self.assertIn('rango_jobs_run_total{outcome="done"}', text)
+
+
+@override_settings(RANGO_TASK_IN_PROCESS_WORKERS=0)
+class WorkerTests(TransactionTestCase):
+    # the pool's threads have their own connections, so the jobs have to be committed
+    def setUp(self):
+        del attempts_seen[:]
+
+    def test_run_workers_command(self):
+        for i in range(5):
+            flaky_job.enqueue(0)
+
+        out = io.StringIO()
+        call_command('run_workers', '--once', '--concurrency=2', stdout=out)
+
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 5)
+        self.assertIn('Workers stopped.', out.getvalue())
+
+    def test_locked_database_is_retried(self):
+        job = flaky_job.enqueue(0)
+        save = Job.save
+        failures = []
+        def locked_once(job, *args, **kwargs):
+            if not failures:
+                failures.append(1)
+                raise OperationalError('database table is locked')
+            return save(job, *args, **kwargs)
+
+        with mock.patch.object(Job, 'save', locked_once), mock.patch.object(tasks.time, 'sleep'):
+            tasks.Worker(concurrency=1).run(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, failures), (Job.DONE, [1]))
+
+    def test_unrecorded_job_is_queued_again(self):
+        job = flaky_job.enqueue(0)
+        with mock.patch('rango.tasks.run_job', side_effect=OperationalError('database table is locked')), \
+                self.assertLogs('rango.tasks', 'ERROR'):
+            tasks.Worker(concurrency=1).execute(tasks.claim(1)[0])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_queue_errors_dont_stop_the_worker(self):
+        flaky_job.enqueue(0)
+        claim = tasks.claim
+        with mock.patch('rango.tasks.claim', side_effect=[OperationalError('database is locked'), claim(1)] + [[]] * 5), \
+                self.assertLogs('rango.tasks', 'ERROR'):
+            tasks.Worker(concurrency=1, poll_interval=0.01).run(once=True)
+
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    @override_settings(RANGO_TASK_IN_PROCESS_WORKERS=1)
+    def test_dead_in_process_worker_is_restarted(self):
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+
+        with mock.patch.object(tasks, '_worker', tasks.Worker()), mock.patch.object(tasks, '_worker_thread', dead), \
+                mock.patch.object(tasks.Worker, 'run') as run:
+            tasks.wake_in_process_worker()
+            self.assertIsNot(tasks._worker_thread, dead)
+            tasks._worker_thread.join()
+        run.assert_called_once_with()
+
+
+class BenchmarkTests(TestCase):
+    def test_generate_matches_populate_shape(self):
+        cats = benchmark.generate(3, 30)
+        self.assertEqual(len(cats), 3)
+        self.assertEqual(sum(len(data['pages']) for data in cats.values()), 30)
+        for data in cats.values():
+            self.assertEqual(set(data), {'pages', 'views', 'likes'})
+
+    def test_run_covers_every_url(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+
+        benchmark.load(benchmark.generate(3, 30), 2)
+        with override_settings(RANGO_VIEW_SPOOL=os.path.join(spool_dir, 'page_views.spool'),
+                               RANGO_VIEW_FLUSH_INTERVAL=3600):
+            results = benchmark.run(requests=2, warmup=0, username='user0')
+
+        self.assertIn('rango:show_category', results)
+        self.assertIn('rango:goto', results)
+        self.assertNotIn('rango:add_page', results)
+        self.assertEqual(results['rango:list_profiles']['status'], 200)
+        self.assertLessEqual(results['rango:index']['p50_ms'], results['rango:index']['p99_ms'])
+
+
+class LoaderTests(TestCase):
+    CSV = (
+        'category,title,url,views,category_views,category_likes\n'
+        'Python,Official Python Tutorial,http://docs.python.org/3/tutorial,15,128,64\n'
+        'Python,Learn Python in 10 Minutes,http://www.korokithakis.net/tutorials/python/,9,128,64\n'
+        'Django,Django Rocks,http://www.djangorocks.com/,20,64,32\n'
+        'Empty,,,,1,1\n'
+    )
+
+    def test_loads_csv(self):
+        stats = Loader(batch_size=2).load(read_csv(io.StringIO(self.CSV)))
+
+        self.assertEqual(stats['rows'], 4)
+        self.assertEqual(stats['categories_created'], 3)
+        self.assertEqual(stats['pages_created'], 3)
+        self.assertEqual(Category.objects.get(name='Python').likes, 64)
+        self.assertEqual(Category.objects.get(name='Empty').slug, 'empty')
+        self.assertEqual(Page.objects.get(title='Django Rocks').category.slug, 'django')
+
+    def test_rerun_is_idempotent(self):
+        Loader().load(read_csv(io.StringIO(self.CSV)))
+        stats = Loader().load(read_csv(io.StringIO(self.CSV)))
+
+        self.assertEqual(stats['categories_created'] + stats['categories_updated'], 0)
+        self.assertEqual(stats['pages_created'] + stats['pages_updated'], 0)
+        self.assertEqual(Page.objects.count(), 3)
+
+    def test_updates_changed_rows(self):
+        Loader().load(read_csv(io.StringIO(self.CSV)))
+        stats = Loader().load([{'category': 'Django', 'title': 'Django Rocks', 'url': 'http://www.djangorocks.com/', 'views': '25'}])
+
+        self.assertEqual(stats['pages_updated'], 1)
+        self.assertEqual(Page.objects.get(title='Django Rocks').views, 25)
+
+    def test_indexes_only_loaded_categories(self):
+        Loader().load(read_csv(io.StringIO(self.CSV)))
+        with mock.patch('rango.search_index.rebuild') as rebuild:
+            Loader().load([{'category': 'Flask', 'title': 'Flask', 'url': 'http://flask.pocoo.org'}])
+
+        rebuild.assert_not_called()
+        self.assertEqual([r['object'].title for r in search_index.search('flask') if r['kind'] == 'page'], ['Flask'])
+        self.assertEqual(len(search_index.search('korokithakis')), 1)
+
+    def test_command_reads_jsonl(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'pages.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'category': 'Other Frameworks', 'title': 'Flask', 'url': 'http://flask.pocoo.org', 'views': 11}) + '\n')
+
+        out = io.StringIO()
+        call_command('load_rango_data', path, stdout=out)
+
+        self.assertIn('1 pages created', out.getvalue())
+        self.assertEqual(Page.objects.get(title='Flask').category.name, 'Other Frameworks')
+
+
+class VisitorCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_session_written_once_a_day(self):
+        response = self.client.get(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 1)
+        self.assertIn('sessionid', response.cookies)
+
+        # same day - the session is left alone
+        response = self.client.get(reverse('rango:about'))
+        self.assertContains(response, 'Visits: 1')
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertIsInstance(self.client.session['last_visit'], int)
+
+        with mock.patch('rango.views.time.time', return_value=time.time() + 25 * 60 * 60):
+            response = self.client.get(reverse('rango:about'))
+        self.assertContains(response, 'Visits: 2')
+        self.assertIn('sessionid', response.cookies)
+
+    def test_old_string_timestamps_still_count(self):
+        session = self.client.session
+        session['visits'] = 4
+        session['last_visit'] = '2020-02-06 15:03:00.123456'
+        session.save()
+
+        response = self.client.get(reverse('rango:about'))
+        self.assertContains(response, 'Visits: 5')
+        self.assertIsInstance(self.client.session['last_visit'], int)
@@ -0,0 +1,58 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# query parameters that only say where a click came from, not which page it is
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'yclid', '_ga', 'igshid'}
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+HAS_SCHEME = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+
+
+def is_tracking(param):
+    param = param.lower()
+    return param in TRACKING_PARAMS or param.startswith(TRACKING_PREFIXES)
+
+def canonicalize(url):
+    '''
+        The form of a url we compare pages by: http:// added if there's no scheme,
+        scheme and host lower cased, default port, fragment, trailing slash and
+        tracking parameters dropped, and the remaining parameters sorted.
+
+            >>> canonicalize('WWW.Python.org:80/Tutorial/?utm_source=x&b=2&a=1#intro')
+            'http://www.python.org/Tutorial?a=1&b=2'
+    '''
+    url = url.strip()
+    if not HAS_SCHEME.match(url):
+        url = f'http://{url}'
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    try:
+        port = parts.port
+    except ValueError:
+        # not a number, leave it for the url validation to complain about
+        port = None
+
+    host = (parts.hostname or '').rstrip('.')
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    if parts.username:
+        credentials = parts.username + (f':{parts.password}' if parts.password else '')
+        host = f'{credentials}@{host}'
+
+    path = parts.path.rstrip('/') or '/'
+
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking(k)]
+    query = urlencode(sorted(params))
+
+    return urlunsplit((scheme, host, path, query, ''))
+
+def url_hash(url):
+    '''
+        Fixed length key for the canonical url, what Page.url_hash is indexed on.
+    '''
+    return hashlib.sha256(canonicalize(url).encode('utf-8')).hexdigest()
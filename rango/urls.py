@@ -1,6 +1,6 @@
 from django.urls import path
 from rango import views
-from rango.views import AboutView, AddCategoryView, IndexView, AddPageView, ShowCategoryView, RestrictedView, RegisterProfileView, GoToView, ProfileView, ListProfileView
+from rango.views import AboutView, AddCategoryView, IndexView, AddPageView, ShowCategoryView, RestrictedView, RegisterProfileView, GoToView, ProfileView, ListProfileView, CategoryPagesJSONView, SearchView, LikeCategoryView, AddPagesView
 
 
 app_name = 'rango'
@@ -10,13 +10,16 @@ urlpatterns = [
     path('about/', views.AboutView.as_view(), name='about'),
     #use of category_name_slug below must match parameter name in view definition
     path('category/<slug:category_name_slug>/', views.ShowCategoryView.as_view(), name='show_category'),
+    path('category/<slug:category_name_slug>/pages.json', views.CategoryPagesJSONView.as_view(), name='category_pages_json'),
+    path('category/<slug:category_name_slug>/like/', views.LikeCategoryView.as_view(), name='like_category'),
     path('add_category/', views.AddCategoryView.as_view(), name='add_category'),
     path('category/<slug:category_name_slug>/add_page/', views.AddPageView.as_view(), name='add_page'),
+    path('category/<slug:category_name_slug>/add_pages/', views.AddPagesView.as_view(), name='add_pages'),
     #path('register/', views.register, name='register'),
     #path('login/', views.user_login, name='login'),
     path('restricted/', views.RestrictedView.as_view(), name='restricted'),
     #path('logout/', views.user_logout, name='logout'),
-    #path('search/', views.search, name='search'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('goto/', views.GoToView.as_view(), name='goto'),
     path('register_profile/', views.RegisterProfileView.as_view(), name='register_profile'),
     path('profile/<username>/', views.ProfileView.as_view(), name='profile'),
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal, receiver
+from django.test.signals import setting_changed
+from rango.metrics import registry
+from rango.tasks import task
+
+# sent after every flush so we can hook in metrics (or anything else)
+# counts maps page id -> number of views written in this batch
+page_views_flushed = Signal(providing_args=['counts', 'duration'])
+
+
+class ViewCounter(object):
+    '''
+        Write-behind counter for page clicks.
+
+        Each click is appended to a local spool file (so nothing is lost if the
+        process restarts) and the spool is applied to the database in batches
+        by a background job (see rango.tasks), using F('views') + n so
+        concurrent flushes never lose increments.
+    '''
+
+    def __init__(self, spool_path=None, flush_size=None, flush_interval=None):
+        self.spool_path = spool_path or getattr(settings, 'RANGO_VIEW_SPOOL',
+                                                os.path.join(settings.BASE_DIR, 'page_views.spool'))
+        self.flush_size = flush_size or getattr(settings, 'RANGO_VIEW_FLUSH_SIZE', 100)
+        self.flush_interval = flush_interval or getattr(settings, 'RANGO_VIEW_FLUSH_INTERVAL', 5)
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = 0
+        self.last_flush = time.time()
+        self.next_queue = 0
+
+    def record(self, page_id):
+        # append the click to the spool - this is all the request has to wait for
+        with self.lock:
+            with open(self.spool_path, 'a') as f:
+                f.write(f'{int(page_id)}\n')
+            self.pending = self.pending + 1
+            due = self.pending >= self.flush_size or time.time() - self.last_flush >= self.flush_interval
+
+        # flush now if enough clicks are waiting, otherwise make sure a quiet site still gets them written out
+        self.queue_flush(0 if due else self.flush_interval)
+
+    def queue_flush(self, delay):
+        # a worker does the writing, there's no need to ask again while the job we got can't have started
+        with self.lock:
+            if delay and time.time() < self.next_queue:
+                return
+            if not delay:
+                # start counting again, so the clicks after this one don't all ask too
+                self.pending = 0
+                self.last_flush = time.time()
+
+        job = flush_spooled_views.enqueue(key='flush_page_views', delay=delay)
+        with self.lock:
+            self.next_queue = min(job.run_after.timestamp(), time.time() + delay)
+
+    def has_spooled(self):
+        try:
+            return os.path.getsize(self.spool_path) > 0
+        except FileNotFoundError:
+            return False
+
+    def batch_path(self):
+        # unique, so a batch left over from a failed flush is never written over
+        return f'{self.spool_path}.{os.getpid()}.{uuid.uuid4().hex}.flushing'
+
+    def claim_batches(self):
+        '''
+            Our own batches (including any a failed flush left behind), plus any
+            left behind by a process that died mid-flush.
+        '''
+        spool_dir = os.path.dirname(self.spool_path) or '.'
+        spool_name = os.path.basename(self.spool_path)
+        batches = []
+
+        for name in sorted(os.listdir(spool_dir)):
+            if not (name.startswith(f'{spool_name}.') and name.endswith('.flushing')):
+                continue
+
+            path = os.path.join(spool_dir, name)
+            pid = int(name[len(spool_name) + 1:].split('.')[0])
+
+            if pid == os.getpid():
+                batches.append(path)
+            elif not pid_alive(pid):
+                # rename to claim it, whoever loses the race just skips it
+                claimed = self.batch_path()
+                try:
+                    os.rename(path, claimed)
+                    batches.append(claimed)
+                except FileNotFoundError:
+                    pass
+
+        return batches
+
+    def read_counts(self, path):
+        counts = Counter()
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    counts[int(line)] += 1
+        return counts
+
+    def flush(self):
+        '''
+            Apply everything in the spool to the database, returns the page id -> views written.
+        '''
+        with self.flush_lock:
+            with self.lock:
+                self.pending = 0
+                self.last_flush = time.time()
+
+                # move the spool aside so new clicks start a fresh file
+                try:
+                    os.rename(self.spool_path, self.batch_path())
+                except FileNotFoundError:
+                    pass
+
+            batches = self.claim_batches()
+
+            counts = Counter()
+            for path in batches:
+                counts.update(self.read_counts(path))
+
+            if not counts:
+                return {}
+
+            start = time.time()
+            self.write(counts)
+            duration = time.time() - start
+
+            for path in batches:
+                os.remove(path)
+
+        page_views_flushed.send(sender=self.__class__, counts=dict(counts), duration=duration)
+        return dict(counts)
+
+    def write(self, counts):
+        from rango import aggregates
+        from rango.models import Page
+
+        # group pages by increment so most flushes are only a handful of UPDATEs
+        by_increment = {}
+        for page_id, n in counts.items():
+            by_increment.setdefault(n, []).append(page_id)
+
+        with transaction.atomic():
+            for n, page_ids in by_increment.items():
+                Page.objects.filter(id__in=page_ids).update(views=F('views') + n)
+            # and the same views on each page's category
+            aggregates.views_added(counts)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+def get_view_counter():
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = ViewCounter()
+    return _counter
+
+@receiver(setting_changed)
+def reset_view_counter(**kwargs):
+    global _counter
+    if kwargs['setting'].startswith('RANGO_VIEW_'):
+        _counter = None
+
+def record_page_view(page_id):
+    get_view_counter().record(page_id)
+
+def flush_page_views():
+    return get_view_counter().flush()
+
+@task(max_attempts=3)
+def flush_spooled_views():
+    # run by a worker, which may be in another process - the spool file is shared
+    counter = get_view_counter()
+    views = sum(counter.flush().values())
+    if counter.has_spooled():
+        # clicks that came in while we were writing, their processes may think this job has them covered
+        flush_spooled_views.enqueue(key='flush_page_views', delay=counter.flush_interval)
+    return views
+
+
+# totals for /metrics, kept up to date through the flush signal
+flush_totals = {'flushes': 0, 'views': 0, 'seconds': 0.0}
+
+@receiver(page_views_flushed)
+def count_flush(sender, counts, duration, **kwargs):
+    flush_totals['flushes'] = flush_totals['flushes'] + 1
+    flush_totals['views'] = flush_totals['views'] + sum(counts.values())
+    flush_totals['seconds'] = flush_totals['seconds'] + duration
+
+@registry.register
+def view_counter_metrics():
+    return [
+        ('rango_page_view_flushes_total', 'counter', 'Batches of page views written to the database.',
+         [({}, flush_totals['flushes'])]),
+        ('rango_page_views_flushed_total', 'counter', 'Page views written to the database.',
+         [({}, flush_totals['views'])]),
+        ('rango_page_view_flush_seconds_total', 'counter', 'Time spent writing page views.',
+         [({}, flush_totals['seconds'])]),
+    ]
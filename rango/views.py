@@ -1,24 +1,56 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
-from rango.models import Category, Page, UserProfile
+from rango.models import Page, UserProfile
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from rango.forms import CategoryForm, PageForm, UserForm, UserProfileForm
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from datetime import datetime
-from rango.bing_search import run_query
+import json
+import os
+import time
+from rango import search_queue
+from rango.view_counter import record_page_view
+from rango.likes import like_category, pending_likes
+from rango.loader import add_pages, read_page_rows
+from rango.caching import get_page_url, get_category, get_profiles_version
+from rango.leaderboard import top_categories, top_pages
+from rango.pagination import keyset_page, iterate_pages, IdPage
+from rango import search_index
+from rango.response_cache import INDEX, SIDEBAR, cache_anonymous, category_scope
+from rango.images import VARIANTS_DIR, clear_variants, generate_variants_later
+from django.views.static import serve
+from rango.metrics import registry
 from django.views import View
 from django.utils.decorators import method_decorator
 
+# a visit is counted at most once in this many seconds
+VISIT_INTERVAL = 24 * 60 * 60
+
+def count_visit(request):
+    # the index counts the visit but doesn't show it, so one cached copy does for everyone
+    visitor_cookie_handler(request)
+
+def visit_count(request):
+    # the about page shows the count, so each count gets its own cached copy
+    return visitor_cookie_handler(request)
+
+def category_page_scopes(request, category_name_slug):
+    # a category page only goes stale when that category (or the sidebar) changes
+    return [SIDEBAR, category_scope(category_name_slug)]
+
 class IndexView(View):
+    @method_decorator(cache_anonymous(vary=count_visit, scopes=[INDEX, SIDEBAR]))
     def get(self, request):
         # construct a dictionary to pass template engine as its context
         # boldmessage matches template variable in index.html
-        # query database for all categories, order by number of likes
-        # retrieve only top 5, place in context_dict
-        category_list = Category.objects.order_by('-likes')[:5]
-        page_list = Page.objects.order_by('-views')[:5]
+        # top categories by likes and top pages by views
+        # these come from the cached leaderboards rather than sorting the tables
+        category_list = top_categories()
+        page_list = top_pages()
 
         context_dict = {}
         context_dict['boldmessage'] = 'Crunchy, creamy, cookie, candy, cupcake!'
@@ -33,52 +65,111 @@ class IndexView(View):
         return response
 
 class AboutView(View):
+    @method_decorator(cache_anonymous(vary=visit_count, scopes=[SIDEBAR]))
     def get(self, request):
         context_dict = {}
 
-        visitor_cookie_handler(request)
-        context_dict['visits'] = request.session['visits']
+        context_dict['visits'] = visitor_cookie_handler(request)
 
         return render(request, 'rango/about.html', context_dict)
 
 class ShowCategoryView(View):
 
-    def create_context_dict(self, category_name_slug):
+    def create_context_dict(self, category_name_slug, cursor=None):
         context_dict = {}
 
-        try:
-            # find category from slug?
-            category = Category.objects.get(slug=category_name_slug)
+        # find category from slug? (shared, cached lookup)
+        category = get_category(category_name_slug, self.request)
 
-            # retrieve all pages in this category (using filter())
+        if category is not None:
+            # retrieve one batch of pages in this category, most viewed first
+            # the cursor marks where the previous batch finished
             pages = Page.objects.filter(category=category)
-            page_list = pages.order_by('-views')
+            page_list, next_cursor = keyset_page(pages, cursor, settings.RANGO_CATEGORY_PAGE_SIZE)
             # Add results to context dict
             context_dict['pages'] = page_list
+            context_dict['next_cursor'] = next_cursor
 
             # Also add category to verify (in the template) it exists
             context_dict['category'] = category
-        except Category.DoesNotExist:
+        else:
             context_dict['category'] = None
             context_dict['pages'] = None
 
         return context_dict
 
+    def add_search(self, context_dict, query, retry_failed=False):
+        # both searches run on the task queue, the page polls with ?query= until they're done
+        category_query = f'{query} {context_dict["category"].name}'
+        (status, result_list), (category_status, category_result_list) = [
+            search_queue.search_later(q, retry_failed) for q in (query, category_query)]
+
+        if search_queue.PENDING in (status, category_status):
+            context_dict['search_pending'] = True
+        elif status == search_queue.FAILED:
+            # don't hold the page up, just show it without results
+            context_dict['search_error'] = 'Search is unavailable right now, please try again later.'
+        context_dict['result_list'] = result_list
+        context_dict['category_result_list'] = category_result_list
+        context_dict['query'] = query
+
+    @method_decorator(cache_anonymous(scopes=category_page_scopes))
     def get(self, request, category_name_slug):
-        context_dict = self.create_context_dict(category_name_slug)
+        context_dict = self.create_context_dict(category_name_slug, request.GET.get('cursor'))
+        query = request.GET.get('query', '').strip()
+
+        if query and context_dict['category'] and request.user.is_authenticated:
+            self.add_search(context_dict, query)
+
         return render(request, 'rango/category.html', context_dict)
 
     @method_decorator(login_required)
     def post(self, request, category_name_slug):
-        context_dict = self.create_context_dict(category_name_slug)
+        context_dict = self.create_context_dict(category_name_slug, request.GET.get('cursor'))
         query = request.POST.get('query').strip()
 
-        if query:
-            context_dict['results_list'] = run_query(query)
-            context_dict['query'] = query
+        if query and context_dict['category']:
+            # searching again is worth another try at a search that failed
+            self.add_search(context_dict, query, retry_failed=True)
 
         return render(request, 'rango/category.html', context_dict)
 
+class CategoryPagesJSONView(View):
+    def get(self, request, category_name_slug):
+        category = get_category(category_name_slug, request)
+        if category is None:
+            return JsonResponse({'error': 'Category not found.'}, status=404)
+
+        pages = Page.objects.filter(category=category).only('id', 'title', 'url', 'views')
+        batches = iterate_pages(pages, settings.RANGO_CATEGORY_STREAM_BATCH_SIZE)
+
+        # stream the JSON array out as we go so memory stays flat however big the category is
+        def stream():
+            yield '['
+            for i, page in enumerate(batches):
+                if i:
+                    yield ','
+                yield json.dumps({'id': page.id, 'title': page.title, 'url': page.url, 'views': page.views})
+            yield ']'
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
+class LikeCategoryView(View):
+    @method_decorator(login_required)
+    def post(self, request, category_name_slug):
+        category = get_category(category_name_slug, request)
+        if category is None:
+            return JsonResponse({'error': 'Category not found.'}, status=404)
+
+        liked = like_category(request.user, category)
+
+        if not request.is_ajax():
+            return redirect(reverse('rango:show_category', kwargs={'category_name_slug': category_name_slug}))
+
+        # likes not yet compacted into the category are counted too, so the button shows the right number
+        category.refresh_from_db(fields=['likes'])
+        return JsonResponse({'liked': liked, 'likes': category.likes + pending_likes(category)})
+
 class AddCategoryView(View):
     @method_decorator(login_required)
     def get(self, request):
@@ -124,12 +215,7 @@ def add_category(request):
 
 class AddPageView(View):
     def get_category_name(self, category_name_slug):
-        try:
-            category = Category.objects.get(slug=category_name_slug)
-        except Category.DoesNotExist:
-            category = None
-
-        return category
+        return get_category(category_name_slug, self.request)
 
     @method_decorator(login_required)
     def get(self, request, category_name_slug):
@@ -154,9 +240,14 @@ class AddPageView(View):
             page = form.save(commit=False)
             page.category = category
             page.views = 0
-            page.save()
-
-            return redirect(reverse('rango:show_category', kwargs={'category_name_slug': category_name_slug}))
+            try:
+                with transaction.atomic():
+                    page.save()
+            except IntegrityError:
+                # someone else added the same url since the form checked
+                form.add_error('url', Page.duplicate_url_message)
+            else:
+                return redirect(reverse('rango:show_category', kwargs={'category_name_slug': category_name_slug}))
         else:
             print(form.errors)
 
@@ -164,6 +255,27 @@ class AddPageView(View):
         return render(request, 'rango/add_page.html', context_dict)
 
 
+class AddPagesView(View):
+    @method_decorator(login_required)
+    def post(self, request, category_name_slug):
+        # many pages at once, as a JSON list or a CSV file in the request body
+        category = get_category(category_name_slug, request)
+        if category is None:
+            return JsonResponse({'error': 'Category not found.'}, status=404)
+
+        try:
+            rows = read_page_rows(request.body.decode('utf-8'), request.content_type)
+        except (UnicodeDecodeError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if len(rows) > settings.RANGO_BULK_PAGES_MAX_ROWS:
+            return JsonResponse({'error': f'At most {settings.RANGO_BULK_PAGES_MAX_ROWS} pages per request.'},
+                                status=413)
+
+        pages, errors = add_pages(category, rows)
+        return JsonResponse({'created': len(pages), 'errors': errors}, status=201 if pages else 400)
+
+
 '''
     --------------- Login/Registration code now handled by registration-redux
     
@@ -248,23 +360,36 @@ class RestrictedView(View):
         return render(request, 'rango/restricted.html')
 
 def visitor_cookie_handler(request):
-    # get number of visits to site
-    # use the COOKIES.get() function
-    visits = int(get_server_side_cookie(request, 'visits', '1'))    # default = 1 if nothing found
-
-    last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()))
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7], '%Y-%m-%d %H:%M:%S')
-
-    # if its been more than a day since last visit
-    if (datetime.now() - last_visit_time).days > 0:
-        visits = visits + 1
-        # update the last visit cookie
-        request.session['last_visit'] = str(datetime.now())
-    else:
-        # set the last visit cookie
-        request.session['last_visit'] = last_visit_cookie
-
-    request.session['visits'] = visits
+    '''
+        Counts one visit per day and returns the number of visits.
+        The session is only written when something changes (the first visit,
+        then at most once a day), so most requests leave it untouched.
+    '''
+    now = int(time.time())
+    visits = get_server_side_cookie(request, 'visits')
+    last_visit = last_visit_timestamp(get_server_side_cookie(request, 'last_visit'))
+
+    if visits is None or last_visit is None:
+        # first visit (or a session from before we kept timestamps)
+        visits = int(visits or 1)
+        request.session['visits'] = visits
+        request.session['last_visit'] = now
+    elif now - last_visit >= VISIT_INTERVAL:
+        # if its been more than a day since last visit
+        visits = int(visits) + 1
+        request.session['visits'] = visits
+        request.session['last_visit'] = now
+
+    return int(visits)
+
+def last_visit_timestamp(value):
+    # last_visit is stored as epoch seconds, older sessions have a str(datetime.now()) instead
+    if isinstance(value, int):
+        return value
+    try:
+        return int(datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S').timestamp())
+    except (TypeError, ValueError):
+        return None
 
 def get_server_side_cookie(request, cookie, default_val=None):
     val = request.session.get(cookie)
@@ -272,6 +397,23 @@ def get_server_side_cookie(request, cookie, default_val=None):
         val = default_val
     return val
 
+class SearchView(View):
+    def search(self, request, query):
+        # searches our own categories and pages using the local full text index
+        query = query.strip()
+        context_dict = {'query': query, 'results': []}
+
+        if query:
+            context_dict['results'] = search_index.search(query, settings.RANGO_SEARCH_RESULTS)
+
+        return render(request, 'rango/search.html', context_dict)
+
+    def get(self, request):
+        return self.search(request, request.GET.get('query', ''))
+
+    def post(self, request):
+        return self.search(request, request.POST.get('query', ''))
+
 '''
 def search(request):
     result_list = []
@@ -287,13 +429,25 @@ class GoToView(View):
     def get(self, request):
         page_id = request.GET.get('page_id')
         try:
-            page = Page.objects.get(id=page_id)
-            page.views = page.views + 1
-            page.save()
-            return redirect(page.url)
-        except Page.DoesNotExist:
+            # usually served from memory, the view count is written behind the redirect
+            url = get_page_url(page_id)
+        except (TypeError, ValueError):
+            url = None
+
+        if url is None:
             return redirect(reverse('index'))
 
+        record_page_view(page_id)
+        return redirect(url)
+
+class MetricsView(View):
+    def get(self, request):
+        # only for scrapers running alongside us, not the outside world
+        if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+            return HttpResponseForbidden()
+
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class RegisterProfileView(View):
     @method_decorator(login_required)
     def get(self, request):
@@ -315,6 +469,8 @@ class RegisterProfileView(View):
             #    profile.picture = request.FILES['picture']
 
             profile.save()
+            if profile.picture:
+                generate_variants_later(profile)
             return redirect(reverse('rango:index'))
         else:
             print(profile_form.errors)
@@ -355,7 +511,12 @@ class ProfileView(View):
         form = UserProfileForm(request.POST, request.FILES, instance=user_profile)
 
         if form.is_valid():
-            form.save(commit=True)
+            profile = form.save(commit=False)
+            if 'picture' in form.changed_data:
+                clear_variants(profile)
+            profile.save()
+            if 'picture' in form.changed_data and profile.picture:
+                generate_variants_later(profile)
             return redirect(reverse('rango:profile', kwargs={'username': username}))
         else:
             print(form.errors)
@@ -363,12 +524,26 @@ class ProfileView(View):
         context_dict = {'user_profile': user_profile, 'selected_user': user, 'form': form}
         return render(request, 'rango/profile.html', context_dict)
 
+def serve_variant(request, path):
+    # variant names change with their content, so browsers can keep them forever
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, VARIANTS_DIR))
+    response['Cache-Control'] = f'public, max-age={settings.RANGO_IMAGE_CACHE_MAX_AGE}, immutable'
+    return response
+
 class ListProfileView(View):
     @method_decorator(login_required)
     def get(self, request):
-        profiles = UserProfile.objects.all()
-
-        return render(request, 'rango/list_profiles.html', {'user_profile_list': profiles})
+        # only what the template shows, with the usernames joined in rather than one query per profile
+        profiles = UserProfile.objects.select_related('user').only('id', 'picture', 'picture_thumbnail', 'user__username')
+        cursor = request.GET.get('cursor')
+        context_dict = {
+            'profile_page': IdPage(profiles, cursor, settings.RANGO_PROFILES_PAGE_SIZE),
+            'cursor': cursor or '',
+            'profiles_version': get_profiles_version(),
+            'cache_timeout': settings.RANGO_PROFILES_CACHE_TIMEOUT,
+        }
+
+        return render(request, 'rango/list_profiles.html', context_dict)
 
 
 
@@ -24,6 +24,92 @@ REGISTRATION_AUTO_LOGIN = True  #if ture, the user will be auto logged in after
 LOGIN_REDIRECT_URL = 'rango:index'
 LOGIN_URL = 'auth_login'
 
+# Page view counter - clicks are spooled to disk and written to the database in batches
+RANGO_VIEW_SPOOL = os.path.join(BASE_DIR, 'page_views.spool')
+RANGO_VIEW_FLUSH_SIZE = 100     # flush once this many clicks are waiting
+RANGO_VIEW_FLUSH_INTERVAL = 5   # or after this many seconds
+
+# Redirect targets for /rango/goto/ are cached per process, and in the shared cache below
+RANGO_REDIRECT_CACHE = 'default'    # cache alias, or None for per-process only
+RANGO_REDIRECT_CACHE_SIZE = 10000
+RANGO_REDIRECT_CACHE_TTL = 60       # seconds, see the note on CACHES
+
+# Homepage leaderboards (most liked categories, most viewed pages), kept in the cache
+RANGO_LEADERBOARD_SIZE = 5
+RANGO_LEADERBOARD_TIMEOUT = 60      # seconds before a full rebuild from the database, see the note on CACHES
+
+# Category pages are listed in batches, each batch continues from a cursor in the url
+RANGO_CATEGORY_PAGE_SIZE = 50
+RANGO_CATEGORY_STREAM_BATCH_SIZE = 500  # rows per query for the JSON stream
+RANGO_CATEGORY_CACHE_SIZE = 1000        # categories looked up by slug, kept per process
+RANGO_CATEGORY_CACHE_TTL = 60           # seconds, other processes' renames show up after this
+RANGO_BULK_PAGES_MAX_ROWS = 5000        # pages per request to the add_pages endpoint
+
+# Likes are logged one row each and added to Category.likes by a job, at most this long after they're made
+RANGO_LIKE_COMPACT_INTERVAL = 10    # seconds
+
+# Most categories listed in the sidebar, None to list them all
+RANGO_SIDEBAR_MAX_CATEGORIES = 50
+RANGO_SIDEBAR_CACHE_TIMEOUT = 60    # seconds, the cache is per process so other processes' changes show up after this
+
+# Whole pages for anonymous visitors (index, about, categories), dropped when something they show changes
+# (in the process that changed it, see the note on CACHES)
+RANGO_RESPONSE_CACHE = 'default'        # cache alias
+RANGO_RESPONSE_CACHE_TIMEOUT = 60       # seconds, no longer than the sidebar's as pages include it
+
+# Most SQL queries each view should need, anything over is logged by the instrumentation middleware
+# (or raises QueryBudgetExceeded when RANGO_QUERY_BUDGET_STRICT is on, e.g. in tests)
+RANGO_QUERY_BUDGETS = {
+    'rango:index': 10,
+    'rango:about': 8,
+    'rango:show_category': 12,    # a search in progress looks up its two jobs
+    'rango:goto': 4,    # 2 more when the view counter queues its flush job
+    'rango:list_profiles': 10,
+    'rango:search': 10,
+}
+RANGO_QUERY_BUDGET_STRICT = False
+
+# Profile directory, listed in batches and cached as a rendered fragment
+RANGO_PROFILES_PAGE_SIZE = 50
+RANGO_PROFILES_CACHE_TIMEOUT = 60   # seconds, see the note on CACHES
+
+# Profile pictures are resized in the background after upload, each variant needs a picture_<name> field
+RANGO_IMAGE_VARIANTS = {
+    'thumbnail': (60, 60),  # the 30x30 profile list, at 2x for high density screens
+    'medium': (300, 300),   # profile.html
+}
+RANGO_IMAGE_FORMAT = 'WEBP'
+RANGO_IMAGE_QUALITY = 80
+RANGO_IMAGE_CACHE_MAX_AGE = 365 * 24 * 60 * 60   # seconds, variant names change with their content
+
+# Background jobs (picture variants, web searches, view count flushes) are queued in the rango_job table
+# and run by `manage.py run_workers`, and by a worker thread in each web process unless that's set to 0
+RANGO_TASK_CONCURRENCY = 4          # jobs each run_workers process runs at once
+RANGO_TASK_POLL_INTERVAL = 1        # seconds between checks of an idle queue
+RANGO_TASK_TIMEOUT = 300            # seconds before a job whose worker went away is run again
+RANGO_TASK_KEEP_FINISHED = 3600     # seconds finished jobs are kept, at least RANGO_SEARCH_CACHE_TTL for searches
+RANGO_TASK_IN_PROCESS_WORKERS = 2
+
+# Results per page from the local full text search
+RANGO_SEARCH_RESULTS = 20
+
+# Bing web search, results are cached per normalized query
+# The API key is read once at startup from RANGO_SEARCH_KEY, $BING_API_KEY or RANGO_SEARCH_KEY_FILE
+RANGO_SEARCH_KEY = None
+RANGO_SEARCH_KEY_FILE = os.path.join(BASE_DIR, 'bing.key')
+# Signal that re-reads the key, e.g. 'SIGHUP'. Off by default, as servers and workers have their own uses for signals
+RANGO_SEARCH_KEY_RELOAD_SIGNAL = None
+RANGO_SEARCH_URL = 'https://api.cognitive.microsoft.com/bing/v7.0/search'
+RANGO_SEARCH_CACHE = 'search'       # cache alias
+RANGO_SEARCH_CACHE_TTL = 3600       # seconds
+RANGO_SEARCH_POOL_SIZE = 10         # keep-alive connections to the API
+RANGO_SEARCH_CONNECT_TIMEOUT = 2    # seconds
+RANGO_SEARCH_READ_TIMEOUT = 5       # seconds
+RANGO_SEARCH_RETRIES = 2
+RANGO_SEARCH_BACKOFF = 0.2          # seconds, doubled for each retry
+RANGO_SEARCH_BREAKER_THRESHOLD = 5  # failures in a row before we stop calling the API
+RANGO_SEARCH_BREAKER_RESET = 30     # seconds before trying again
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.1/howto/deployment/checklist/
 
@@ -33,8 +119,14 @@ SECRET_KEY = 'dqpx*1zgzi6=q$ng$9&u!tzay(c0s15d07caq&s^67iefwo+9o'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# outside of development, refuse to start if the search API key is missing
+RANGO_SEARCH_KEY_REQUIRED = not DEBUG
+
 ALLOWED_HOSTS = []
 
+# addresses allowed to read /metrics
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -45,11 +137,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'rango',
+    'rango.apps.RangoConfig',
     'registration',
 ]
 
 MIDDLEWARE = [
+    'rango.middleware.InstrumentationMiddleware',
+    'rango.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,7 +157,7 @@ ROOT_URLCONF = 'tango_with_django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'rango.template_backends.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR, ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -84,14 +178,73 @@ WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# The primary defaults to the SQLite file below, set RANGO_DB_* in the environment to use another backend
+# RANGO_DB_REPLICAS is a comma separated list of read replicas, hosts (or file names for SQLite)
+def database(**overrides):
+    config = {
+        'ENGINE': os.environ.get('RANGO_DB_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ.get('RANGO_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': os.environ.get('RANGO_DB_USER', ''),
+        'PASSWORD': os.environ.get('RANGO_DB_PASSWORD', ''),
+        'HOST': os.environ.get('RANGO_DB_HOST', ''),
+        'PORT': os.environ.get('RANGO_DB_PORT', ''),
+        # keep connections open between requests rather than reconnecting every time
+        'CONN_MAX_AGE': int(os.environ.get('RANGO_DB_CONN_MAX_AGE', 60)),
     }
+    config.update(overrides)
+    return config
+
+DATABASES = {'default': database()}
+
+replicas = [r.strip() for r in os.environ.get('RANGO_DB_REPLICAS', '').split(',') if r.strip()]
+for i, replica in enumerate(replicas, 1):
+    location = {'NAME': replica} if DATABASES['default']['ENGINE'].endswith('sqlite3') else {'HOST': replica}
+    DATABASES[f'replica{i}'] = database(TEST={'MIRROR': 'default'}, **location)
+
+# Aliases ReplicaRouter reads from while one of RANGO_REPLICA_VIEWS handles a GET
+RANGO_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+RANGO_REPLICA_VIEWS = ['rango:index', 'rango:show_category', 'rango:list_profiles']
+
+DATABASE_ROUTERS = ['rango.db.ReplicaRouter']
+
+# Applied to every new SQLite connection, WAL lets readers carry on while a write is going on
+RANGO_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',    # safe with WAL, only fsyncs at checkpoints
+    'busy_timeout': 5000,       # milliseconds to wait for a lock rather than failing straight away
+    'mmap_size': 256 * 1024 * 1024,
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# The default cache is LocMemCache, which every process keeps for itself. Invalidating it (after a
+# write, a view flush, a like compaction...) only reaches the process that did the work - and jobs run
+# in whichever process claims them, see rango.tasks - so everything kept in it expires within a minute
+# (RANGO_*_TIMEOUT / RANGO_*_TTL above) and other processes catch up then. With a cache every process
+# shares (memcached, redis, FileBasedCache) invalidation reaches them all and those can be raised.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango',
+    },
+    # search results, least recently used queries are evicted first
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango-search',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+
+# Sessions
+# The visit counter only writes to the session once a day, but anonymous visitors still get a
+# session row when they first arrive. To keep anonymous traffic off the database entirely use
+# 'django.contrib.sessions.backends.signed_cookies' (or 'django.contrib.sessions.backends.cache')
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from registration.backends.simple.views import RegistrationView
 from django.urls import reverse
 from rango.views import IndexView
+from rango.images import VARIANTS_DIR
 
 class MyRegistrationView(RegistrationView):
     def get_success_url(self, user):
@@ -30,6 +31,10 @@ urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('rango/', include('rango.urls')),  # maps any URL beginning rango/ to rango app
     path('admin/', admin.site.urls),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('accounts/register/', MyRegistrationView.as_view(), name='registration_register'),
     path('accounts/', include('registration.backends.simple.urls')),
+    # resized profile pictures, served with long lived cache headers
+    path(f'{settings.MEDIA_URL.lstrip("/")}{VARIANTS_DIR}/<path:path>', views.serve_variant,
+         name='picture_variant'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)